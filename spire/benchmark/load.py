@@ -0,0 +1,274 @@
+import cPickle
+import gc
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from spire.wsgi.server import WsgiServer
+
+REPORT_HEADER = '%-12s %9s %10s %8s %8s %8s %8s %7s %12s' % ('scenario', 'requests',
+    'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'errors', 'retained/req')
+
+GENERATOR_SCRIPT = '''
+import cPickle, sys
+from spire.benchmark.load import generate_load
+host, port, path, concurrency, duration = sys.argv[1:]
+result = generate_load((host, int(port)), path, int(concurrency), float(duration))
+cPickle.dump((result.latencies, result.errors, result.elapsed), sys.stdout,
+    cPickle.HIGHEST_PROTOCOL)
+'''
+
+class LoadResult(object):
+    """The outcome of generating load against a server: the latency of every
+    completed request, in seconds, and the number of failed ones."""
+
+    def __init__(self, latencies, errors, elapsed):
+        self.latencies = sorted(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.requests / (self.elapsed or 1e-6)
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return None
+        index = int(round(percent / 100.0 * (len(self.latencies) - 1)))
+        return self.latencies[index]
+
+class KeepAliveClient(object):
+    """A minimal HTTP/1.1 client which sends the same request over a single
+    keep-alive connection for as long as it is asked to."""
+
+    def __init__(self, address, request):
+        self.address = address
+        self.request = request
+        self.socket = None
+        self.data = ''
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def send(self):
+        if self.socket is None:
+            self.socket = socket.create_connection(self.address, 10)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.data = ''
+
+        self.socket.sendall(self.request)
+        status, headers = self._read_head()
+        if headers.get('transfer-encoding') == 'chunked':
+            self._read_chunked()
+        else:
+            self._read_exactly(int(headers.get('content-length', 0)))
+
+        if headers.get('connection') == 'close':
+            self.close()
+        return status
+
+    def _receive(self):
+        data = self.socket.recv(65536)
+        if not data:
+            raise socket.error('connection closed')
+        self.data += data
+
+    def _read_exactly(self, size):
+        while len(self.data) < size:
+            self._receive()
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+    def _read_head(self):
+        end = self.data.find('\r\n\r\n')
+        while end < 0:
+            self._receive()
+            end = self.data.find('\r\n\r\n')
+
+        lines = self._read_exactly(end + 4).split('\r\n')
+        status = int(lines[0].split(' ', 2)[1])
+
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip().lower()
+        return status, headers
+
+    def _read_line(self):
+        end = self.data.find('\r\n')
+        while end < 0:
+            self._receive()
+            end = self.data.find('\r\n')
+        return self._read_exactly(end + 2)
+
+    def _read_chunked(self):
+        while True:
+            size = int(self._read_line().split(';', 1)[0], 16)
+            if not size:
+                while self._read_line() != '\r\n':
+                    pass
+                return
+            self._read_exactly(size + 2)
+
+def construct_request(path, host='localhost'):
+    return 'GET %s HTTP/1.1\r\nHost: %s\r\nAccept: */*\r\n\r\n' % (path, host)
+
+def generate_load(address, path, concurrency=16, duration=10):
+    """Send requests for path to the server at address from concurrency
+    keep-alive clients, each in its own thread, for duration seconds."""
+    request = construct_request(path)
+    latencies, errors = [], [0]
+    guard = threading.Lock()
+
+    deadline = time.time() + duration
+    def drive():
+        client = KeepAliveClient(address, request)
+        completed, failed = [], 0
+        try:
+            while True:
+                started = time.time()
+                if started >= deadline:
+                    break
+                try:
+                    status = client.send()
+                except (socket.error, ValueError):
+                    client.close()
+                    failed += 1
+                    continue
+                if status < 400:
+                    completed.append(time.time() - started)
+                else:
+                    failed += 1
+        finally:
+            client.close()
+            with guard:
+                latencies.extend(completed)
+                errors[0] += failed
+
+    started = time.time()
+    threads = [threading.Thread(target=drive) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return LoadResult(latencies, errors[0], time.time() - started)
+
+def generate_load_in_subprocess(address, path, concurrency=16, duration=10):
+    """Run generate_load() in a new interpreter, so that the clients do not
+    compete with the server for this process's interpreter lock. It is not
+    forked, since this process is usually running server threads."""
+    command = [sys.executable, '-c', GENERATOR_SCRIPT, address[0], str(address[1]),
+        path, str(concurrency), str(duration)]
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    if process.returncode:
+        raise RuntimeError('load generator exited with status %d' % process.returncode)
+
+    latencies, errors, elapsed = cPickle.loads(output)
+    return LoadResult(latencies, errors, elapsed)
+
+def count_retained_objects(application, path, iterations=1000, warmup=100):
+    """Return the net number of objects tracked by the garbage collector
+    which are left per request, whether retained or awaiting collection in
+    reference cycles, after serving requests for path through the whole
+    server stack over a socket pair.
+
+    This is not a count of allocations, which Python 2 cannot measure:
+    objects which are allocated and freed while serving are not counted."""
+    server = WsgiServer(('127.0.0.1', 0), application)
+    request = construct_request(path)
+
+    def serve(count):
+        client, sock = socket.socketpair()
+        connection = server.ConnectionClass(server, sock)
+
+        def send():
+            client.sendall(request * count)
+            client.shutdown(socket.SHUT_WR)
+        def drain():
+            while client.recv(65536):
+                pass
+
+        threads = [threading.Thread(target=send), threading.Thread(target=drain)]
+        for thread in threads:
+            thread.start()
+        try:
+            connection.communicate()
+        finally:
+            connection.close()
+            for thread in threads:
+                thread.join()
+            client.close()
+
+    serve(warmup)
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        serve(iterations)
+        after = len(gc.get_objects())
+    finally:
+        gc.collect()
+        if enabled:
+            gc.enable()
+    return (after - before) / float(iterations)
+
+def run(scenarios=('wsgi', 'application'), concurrency=16, duration=10,
+        engine='threaded', threads=10):
+    """Benchmark each of the named scenarios in turn, serving it with an
+    in-process WsgiServer on a loopback port, and return a report."""
+    from spire.benchmark.scenarios import SCENARIOS
+
+    lines = [REPORT_HEADER]
+    for name in scenarios:
+        application, path = SCENARIOS[name]()
+        retained = count_retained_objects(application, path)
+
+        server = WsgiServer(('127.0.0.1', 0), application, numthreads=threads,
+            engine=engine)
+        server.prepare()
+        address = server.socket.getsockname()[:2]
+
+        thread = threading.Thread(target=server.start)
+        thread.setDaemon(True)
+        thread.start()
+        while not server.ready:
+            time.sleep(.01)
+
+        try:
+            result = generate_load_in_subprocess(address, path, concurrency, duration)
+        finally:
+            server.stop()
+            thread.join(server.shutdown_timeout + 1)
+
+        lines.append(format_result(name, result, retained))
+    return '\n'.join(lines)
+
+def format_result(name, result, retained):
+    def milliseconds(percent):
+        value = result.percentile(percent)
+        if value is None:
+            return '-'
+        return '%.2f' % (value * 1000)
+
+    return '%-12s %9d %10.1f %8s %8s %8s %8s %7d %12.1f' % (name, result.requests,
+        result.throughput, milliseconds(50), milliseconds(90), milliseconds(99),
+        milliseconds(100), result.errors, retained)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        print run(sys.argv[1:])
+    else:
+        print run()
@@ -0,0 +1,60 @@
+from __future__ import absolute_import
+import atexit
+import os
+from tempfile import mkstemp
+
+import scheme
+from mesh.bundle import Bundle, mount
+from mesh.standard import Resource
+
+from spire import schema as _schema
+from spire.core import Assembly
+from spire.mesh.controllers import ModelController
+from spire.mesh.units import MeshServer
+from spire.util import uniqid
+
+class Item(_schema.Model):
+    class meta:
+        schema = 'benchmark'
+
+    id = _schema.UUID(nullable=False, primary_key=True, default=uniqid)
+    name = _schema.Token(nullable=False)
+    value = _schema.Integer()
+
+class ItemResource(Resource):
+    name = 'item'
+    version = 1
+
+    class schema:
+        id = scheme.UUID(nonempty=True)
+        name = scheme.Token(nonempty=True)
+        value = scheme.Integer()
+
+class ItemController(ModelController):
+    resource = ItemResource
+    version = (1, 0)
+
+    model = Item
+    schema = _schema.SchemaDependency('benchmark')
+    mapping = {'id': 'id', 'name': 'name', 'value': 'value'}
+
+BUNDLE = Bundle('benchmark', mount(ItemResource, ItemController))
+
+def construct_mesh_server(items=100):
+    """Construct a MeshServer serving BUNDLE from a new SQLite database of
+    the given number of items, returning it and the path to query them."""
+    fd, filename = mkstemp(suffix='.db')
+    os.close(fd)
+    atexit.register(os.unlink, filename)
+
+    assembly = Assembly().promote()
+    assembly.configure({'schema:benchmark': {'url': 'sqlite:///%s' % filename}})
+
+    interface = _schema.Schema.interface('benchmark')
+    interface.create_schema()
+    with interface.get_engine().begin() as connection:
+        connection.execute(Item.__table__.insert(), *[{'id': uniqid(),
+            'name': 'item%d' % i, 'value': i} for i in range(items)])
+
+    server = MeshServer(path='/api', bundles=[BUNDLE])
+    return server, '/api/benchmark/1.0/item?limit=10'
@@ -0,0 +1,67 @@
+import socket
+import sys
+import time
+
+from spire.wsgi.server import HTTPConnection, HTTPRequest, HTTPServer
+
+COMMON_HEADERS = [
+    ('Host', 'www.example.com'),
+    ('User-Agent', 'Mozilla/5.0 (X11; Linux x86_64; rv:10.0) Gecko/20100101'),
+    ('Accept', 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'),
+    ('Accept-Language', 'en-us,en;q=0.5'),
+    ('Accept-Encoding', 'gzip, deflate'),
+    ('Accept-Charset', 'ISO-8859-1,utf-8;q=0.7,*;q=0.7'),
+    ('Connection', 'keep-alive'),
+    ('Cache-Control', 'max-age=0'),
+    ('Referer', 'http://www.example.com/index.html'),
+    ('Cookie', 'session=4d2f1e0b9c8a7d6e5f4a3b2c1d0e9f8a; preferences=compact'),
+]
+
+def construct_head(count):
+    headers = COMMON_HEADERS[:count]
+    for i in range(count - len(headers)):
+        headers.append(('X-Custom-Header-%d' % i, 'value-%d' % i))
+
+    lines = ['GET /some/resource?query=string HTTP/1.1']
+    lines.extend('%s: %s' % header for header in headers)
+    return '\r\n'.join(lines) + '\r\n\r\n'
+
+def measure(head, iterations, head_buffer_size):
+    server = HTTPServer(('127.0.0.1', 0), None)
+    client, sock = socket.socketpair()
+    connection = HTTPConnection(server, sock)
+    connection.head_buffer_size = head_buffer_size
+
+    elapsed = 0.0
+    try:
+        for i in xrange(iterations):
+            client.sendall(head)
+            request = HTTPRequest(server, connection)
+            started = time.time()
+            request.parse_request()
+            elapsed += time.time() - started
+            if not request.ready:
+                raise RuntimeError('request head failed to parse')
+    finally:
+        client.close()
+        sock.close()
+    return elapsed
+
+def run(iterations=20000, header_counts=(10, 20, 30)):
+    """Compare parsing request heads line by line through the connection's
+    file object with parsing them from the connection's head buffer."""
+    print '%8s %14s %14s %8s' % ('headers', 'line (us)', 'buffered (us)',
+        'speedup')
+    for count in header_counts:
+        head = construct_head(count)
+        line = measure(head, iterations, 0)
+        buffered = measure(head, iterations, HTTPConnection.head_buffer_size)
+        print '%8d %14.2f %14.2f %7.2fx' % (count,
+            line / iterations * 1000000, buffered / iterations * 1000000,
+            line / buffered)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
@@ -0,0 +1,56 @@
+import sys
+import time
+
+from werkzeug.test import create_environ
+from werkzeug.wrappers import Request as WsgiRequest
+
+from spire.wsgi.application import Request
+
+class EagerRequest(WsgiRequest):
+    """Request as it was constructed before its attributes were made lazy."""
+
+    def __init__(self, application, environ, urls):
+        super(EagerRequest, self).__init__(environ)
+        self.application = application
+        self.endpoint = None
+        self.params = None
+        self.template_context = {}
+        self.urls = urls
+
+        for name, value in environ.iteritems():
+            if name[:8] == 'request.':
+                setattr(self, name[8:], value)
+
+def construct_environ(count):
+    headers = [('X-Custom-Header-%d' % i, 'value-%d' % i) for i in range(count)]
+    environ = create_environ('/some/resource?query=string', 'http://www.example.com/',
+        headers=headers)
+    environ['request.context'] = {}
+    environ['request.session'] = {}
+    return environ
+
+def measure(cls, environ, iterations):
+    started = time.time()
+    for i in xrange(iterations):
+        request = cls(None, environ, None)
+        request.endpoint, request.params = 'resource', {}
+    return time.time() - started
+
+def run(iterations=100000, header_counts=(10, 20, 30)):
+    """Compare constructing requests eagerly, copying 'request.*' environ
+    entries and creating a template context, with constructing them lazily."""
+    print '%8s %14s %14s %8s' % ('headers', 'eager (us)', 'lazy (us)',
+        'speedup')
+    for count in header_counts:
+        environ = construct_environ(count)
+        eager = measure(EagerRequest, environ, iterations)
+        lazy = measure(Request, environ, iterations)
+        print '%8d %14.2f %14.2f %7.2fx' % (count,
+            eager / iterations * 1000000, lazy / iterations * 1000000,
+            eager / lazy)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
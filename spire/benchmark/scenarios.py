@@ -0,0 +1,37 @@
+import sys
+
+from werkzeug.routing import Rule
+
+from spire.wsgi.application import Application, view
+from spire.wsgi.util import MountDispatcher
+
+def hello_application(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+        ('Content-Length', '5')])
+    return ['hello']
+
+@view('hello')
+def hello(request):
+    return 'hello'
+
+def construct_wsgi():
+    """A trivial WSGI callable."""
+    return hello_application, '/'
+
+def construct_application():
+    """A spire Application with a single view behind a MountDispatcher."""
+    application = Application(path='/app', urls=[Rule('/hello', endpoint='hello')],
+        views=[sys.modules[__name__]])
+    return MountDispatcher([application]), '/app/hello'
+
+def construct_mesh():
+    """A MeshServer exposing a ModelController over a SQLite database."""
+    from spire.benchmark.meshapp import construct_mesh_server
+    server, path = construct_mesh_server()
+    return MountDispatcher([server]), path
+
+SCENARIOS = {
+    'wsgi': construct_wsgi,
+    'application': construct_application,
+    'mesh': construct_mesh,
+}
@@ -8,7 +8,7 @@ from spire.exceptions import *
 from spire.support.logs import LogHelper
 from spire.util import get_constructor_args, identify_object
 
-__all__ = ('Component', 'ConfigurableUnit', 'Unit')
+__all__ = ('Component', 'ConfigurableUnit', 'Unit', 'Warmable')
 
 log = LogHelper('spire.core')
 
@@ -153,3 +153,10 @@ class ConfigurableUnit(Unit, Configurable):
 
 class Component(Unit, Configurable):
     """A component."""
+
+class Warmable(object):
+    """A unit which can prepare itself before serving."""
+
+    def warmup(self):
+        """Prepare this unit to serve, such as by compiling its templates;
+        called by the runtime at startup, before any fork."""
@@ -11,6 +11,7 @@ from spire.context import ContextMiddleware, HeaderParser
 from spire.local import ContextLocals
 from spire.schema.fields import Column, TypeDecorator, types
 from spire.wsgi.application import Request
+from spire.wsgi.compression import CompressionMiddleware
 from spire.wsgi.util import Mount
 
 __all__ = ('Definition', 'DefinitionType', 'ExplicitContextManager', 'MeshClient',
@@ -131,6 +132,9 @@ class MeshServer(Mount):
         'server': ObjectReference(nonnull=True, default=HttpServer),
     })
 
+    # Only constructed when 'compression' is listed in middleware.
+    compression = Dependency(CompressionMiddleware, optional=True)
+
     def __init__(self, bundles, server, mediators=None):
         self.mediators = []
         if mediators:
@@ -4,7 +4,7 @@ from time import sleep
 
 from scheme import *
 
-from spire.core import Assembly
+from spire.core import Assembly, Warmable
 from spire.exceptions import TemporaryStartupError
 from spire.support.logs import LogHelper, configure_logging
 from spire.util import enumerate_tagged_methods, recursive_merge, topological_sort
@@ -84,10 +84,20 @@ class Runtime(object):
         pass
 
     def startup(self):
-        if not self.parameters['startup_enabled']:
+        if self.parameters['startup_enabled']:
+            self._startup_components()
+        else:
             log('warning', 'skipping startup of components')
-            return
+        self.warmup()
+
+    def warmup(self):
+        for unit in self.assembly.collate(Warmable):
+            try:
+                unit.warmup()
+            except Exception:
+                log('exception', 'warmup of %r raised exception', unit)
 
+    def _startup_components(self):
         attempts = self.parameters['startup_attempts']
         timeout = self.parameters['startup_timeout']
 
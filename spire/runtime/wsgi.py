@@ -1,12 +1,31 @@
 import os
 import sys
 
-from werkzeug.wsgi import SharedDataMiddleware
-
 from spire.runtime.runtime import Runtime
 from spire.wsgi.server import WsgiServer
+from spire.wsgi.static import StaticFiles
 from spire.wsgi.util import Mount, MountDispatcher
 
+SERVER_PARAMETERS = {
+    'accept-batch': 'accept_batch',
+    'body-timeout': 'body_timeout',
+    'defer-accept': 'defer_accept',
+    'engine': 'engine',
+    'handoff': 'handoff',
+    'header-timeout': 'header_timeout',
+    'max-queue-size': 'max_queue_size',
+    'max-queue-wait': 'max_queue_wait',
+    'max-threads': 'maxthreads',
+    'minimum-rate': 'minimum_rate',
+    'processes': 'processes',
+    'reuse-port': 'reuse_port',
+    'spool-threshold': 'spool_threshold',
+    'statistics': 'statistics',
+    'target-wait': 'target_wait',
+    'threads': 'numthreads',
+    'timeout': 'timeout',
+}
+
 class Runtime(Runtime):
     def __init__(self, address, configuration=None, assembly=None):
         super(Runtime, self).__init__(configuration, assembly)
@@ -17,14 +36,17 @@ class Runtime(Runtime):
         for unit in self.assembly.collate(Mount):
             self.dispatcher.mount(unit)
 
-        wsgi = self.configuration.get('wsgi')
-        if wsgi and 'static-map' in wsgi:
-            map = wsgi['static-map'].split('=')
-            self.dispatcher = SharedDataMiddleware(self.dispatcher, {
-                map[0]: os.path.abspath(map[1])
-            }, cache=False)
+        wsgi = self.configuration.get('wsgi') or {}
+        if 'static-map' in wsgi:
+            path, root = wsgi['static-map'].split('=')
+            self.dispatcher.mount(StaticFiles(path=path, root=os.path.abspath(root)))
+
+        params = {}
+        for key, param in SERVER_PARAMETERS.iteritems():
+            if key in wsgi:
+                params[param] = wsgi[key]
 
-        self.server = WsgiServer(address, self.dispatcher)
+        self.server = WsgiServer(address, self.dispatcher, **params)
         self.server.serve()
 
 if __name__ == '__main__':
@@ -31,6 +31,24 @@ class DumpConfiguration(SpireTask):
         self.driver.deploy()
         runtime.report(pformat(self.assembly.configuration), True)
 
+class RunBenchmark(Task):
+    name = 'spire.benchmark'
+    description = 'benchmarks the spire wsgi server stack'
+    parameters = {
+        'concurrency': Integer(description='number of keep-alive clients', default=16),
+        'duration': Integer(description='seconds of load per scenario', default=10),
+        'engine': Enumeration('threaded event', description='server engine',
+            default='threaded'),
+        'scenarios': Sequence(Enumeration('wsgi application mesh'),
+            description='scenarios to benchmark', default=['wsgi', 'application']),
+        'threads': Integer(description='number of server threads', default=10),
+    }
+
+    def run(self, runtime):
+        from spire.benchmark.load import run
+        runtime.report(run(self['scenarios'], self['concurrency'], self['duration'],
+            self['engine'], self['threads']), True)
+
 class StartDaemon(Task):
     name = 'spire.daemon'
     description = 'starts a spire server using the daemon driver'
@@ -1,4 +1,10 @@
-from scheme import Sequence, Text, Tuple
+from collections import OrderedDict
+from copy import deepcopy
+from inspect import getargspec, isfunction, ismethod
+from threading import Lock
+from uuid import UUID
+
+from scheme import Boolean, Integer, Sequence, Text, Tuple
 from scheme.supplemental import ObjectReference
 from werkzeug.exceptions import HTTPException, InternalServerError, NotFound
 from werkzeug.local import Local, release_local
@@ -7,26 +13,110 @@ from werkzeug.wrappers import Request as WsgiRequest, Response
 
 from spire.core import *
 from spire.local import ContextLocals
-from spire.util import call_with_supported_params, enumerate_modules, is_class, is_module, is_package
+from spire.support.logs import LogHelper
+from spire.util import enumerate_modules, is_class, is_module, is_package
 from spire.wsgi.templates import TemplateEnvironment
 from spire.wsgi.util import Mount
 
 ContextLocal = ContextLocals.declare('wsgi.request')
 
+SCALAR_PARAM_TYPES = (basestring, bool, float, int, long, type(None), UUID)
+log = LogHelper('spire.wsgi')
+
+class RouteCache(object):
+    """A cache of the endpoints and params matched by a url map.
+
+    Entries are keyed on the inputs werkzeug matches against, the request
+    method, host (or subdomain) and path, and only successful matches are
+    cached, so redirects, 404s and 405s are always left to werkzeug. Matches
+    of static rules, which have no arguments, are kept in a plain dict of up
+    to size entries, looked up without a lock; other matches (and static
+    ones once that is full) go in a least recently used cache of size
+    entries.
+
+    The cache does not notice changes to the map, so invalidate() must be
+    called after rules are added to it. Each match returns its own copy of
+    the params, with any values other than strings, numbers and UUIDs (such
+    as lists from custom converters) deep-copied.
+    """
+
+    def __init__(self, urls, size=1024):
+        self.urls = urls
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.static = {}
+
+    def invalidate(self):
+        """Discard every cached match."""
+        with self.lock:
+            self.entries.clear()
+            self.static = {}
+
+    def match(self, adapter):
+        """Match the request adapter is bound to, returning its endpoint and
+        params as adapter.match() would."""
+        urls = self.urls
+        key = (adapter.default_method, urls.host_matching and adapter.server_name
+            or adapter.subdomain, adapter.path_info)
+
+        entry = self.static.get(key)
+        if entry is None:
+            with self.lock:
+                entry = self.entries.pop(key, None)
+                if entry is not None:
+                    self.entries[key] = entry
+
+        if entry is None:
+            rule, params = adapter.match(return_rule=True)
+            scalar = all(isinstance(value, SCALAR_PARAM_TYPES)
+                for value in params.itervalues())
+            entry = (rule.endpoint, params, scalar)
+            if not rule.arguments and len(self.static) < self.size:
+                self.static[key] = entry
+            else:
+                with self.lock:
+                    self.entries[key] = entry
+                    while len(self.entries) > self.size:
+                        self.entries.popitem(last=False)
+
+        endpoint, params, scalar = entry
+        if scalar:
+            return endpoint, dict(params)
+        return endpoint, deepcopy(params)
+
 class Request(WsgiRequest):
-    """A WSGI request."""
+    """A WSGI request.
+
+    Environ entries named 'request.*' (such as 'request.session') are
+    available as attributes of the same name without the prefix, resolved
+    when they are first accessed.
+    """
 
     def __init__(self, application, environ, urls):
         super(Request, self).__init__(environ)
         self.application = application
         self.endpoint = None
         self.params = None
-        self.template_context = {}
         self.urls = urls
+        self._template_context = None
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['environ']['request.' + name]
+        except KeyError:
+            raise AttributeError(name)
 
-        for name, value in environ.iteritems():
-            if name[:8] == 'request.':
-                setattr(self, name[8:], value)
+    @property
+    def template_context(self):
+        template_context = self._template_context
+        if template_context is None:
+            template_context = self._template_context = {}
+        return template_context
+
+    @template_context.setter
+    def template_context(self, value):
+        self._template_context = value
 
     def bind(self):
         ContextLocal.push(self)
@@ -40,7 +130,11 @@ class Request(WsgiRequest):
             return
 
         try:
-            self.endpoint, self.params = self.urls.match()
+            routes = self.application.routes
+            if routes is not None:
+                self.endpoint, self.params = routes.match(self.urls)
+            else:
+                self.endpoint, self.params = self.urls.match()
         except (HTTPException, RequestRedirect), error:
             return error
         else:
@@ -51,13 +145,44 @@ class Request(WsgiRequest):
         response.data = self.render_template(template, context, **params)
         return response
 
+    def render_stream(self, template, context=None, response=None, mimetype='text/html',
+            **params):
+        """Like render(), but with a response which renders the template as
+        it is iterated, so that output can be sent as it is produced.
+
+        Only this request is bound again while the template renders; other
+        context locals, such as the mesh context, are not restored, so mesh
+        clients fall back to this request's context."""
+        response = response or Response(mimetype=mimetype)
+        response.response = self.stream_template(template, context, **params)
+        return response
+
     def render_template(self, template, context=None, **params):
+        return self.application.environment.render_template(template,
+            self._update_template_context(context, params))
+
+    def stream_template(self, template, context=None, **params):
+        application = self.application
+        stream = application.environment.stream_template(template,
+            self._update_template_context(context, params), application.template_buffering)
+        return self._iterate_bound(stream)
+
+    def _iterate_bound(self, stream):
+        # The template is rendered after the view returns, so the request is
+        # bound again for the duration.
+        self.bind()
+        try:
+            for chunk in stream:
+                yield chunk
+        finally:
+            self.unbind()
+
+    def _update_template_context(self, context, params):
         template_context = self.template_context
         for contribution in (context, params):
             if contribution:
                 template_context.update(contribution)
-
-        return self.application.environment.render_template(template, template_context)
+        return template_context
 
     def unbind(self):
         ContextLocal.pop()
@@ -70,12 +195,18 @@ class Application(Mount):
 
     configuration = Configuration({
         'mediators': Sequence(Text(nonempty=True), unique=True),
+        'route_cache_size': Integer(minimum=0, default=1024),
+        'template_buffering': Integer(minimum=0, default=5),
+        'template_cache': Text(nonempty=True),
+        'template_warmup': Boolean(default=False),
         'templates': Sequence(Tuple((Text(nonempty=True), Text(nonempty=True)))),
         'urls': ObjectReference(nonnull=True, required=True),
         'views': Sequence(ObjectReference(nonnull=True), unique=True),
     })
 
-    def __init__(self, urls, views=None, templates=None, mediators=None):
+    def __init__(self, urls, views=None, templates=None, mediators=None,
+            route_cache_size=1024, template_cache=None, template_warmup=False,
+            template_buffering=5):
         super(Application, self).__init__()
         if isinstance(urls, (list, tuple)):
             urls = Map(list(urls))
@@ -83,11 +214,18 @@ class Application(Mount):
             raise Exception()
 
         self.urls = urls
+        self.routes = None
+        if route_cache_size:
+            self.routes = RouteCache(urls, route_cache_size)
         self.views = self._collect_views(views)
+        self.invokers = dict((endpoint, construct_invoker(view))
+            for endpoint, view in self.views.iteritems())
 
         self.environment = None
         if templates:
-            self.environment = TemplateEnvironment(templates)
+            self.environment = TemplateEnvironment(templates, cache_dir=template_cache)
+        self.template_warmup = template_warmup
+        self.template_buffering = template_buffering
 
         self.mediators = []
         if mediators:
@@ -95,9 +233,22 @@ class Application(Mount):
                 attr = getattr(self, mediator)
                 self.mediators.append(attr)
 
+        # Each phase only visits the mediators which override its method,
+        # exceptions and responses in reverse order.
+        self.request_mediators = self._collect_mediator_methods('mediate_request')
+        self.exception_mediators = self._collect_mediator_methods('mediate_exception', True)
+        self.response_mediators = self._collect_mediator_methods('mediate_response', True)
+
     def contribute_params(self):
         return {'application': self}
 
+    def warmup(self):
+        if self.environment is None or not self.template_warmup:
+            return
+
+        for name, exception in self.environment.precompile():
+            log('warning', 'template %s of %r failed to compile: %s', name, self, exception)
+
     def dispatch(self, environ, start_response):
         try:
             return self._dispatch_request(environ)(environ, start_response)
@@ -112,48 +263,59 @@ class Application(Mount):
         request.bind()
         try:
 
-            mediators = self.mediators
-            for mediator in mediators:
-                response = mediator.mediate_request(request)
+            for mediate_request in self.request_mediators:
+                response = mediate_request(request)
                 if isinstance(response, Response):
                     break
                 else:
                     response = None
 
-            view = None
+            invoker = None
             if not response:
                 response = request.match()
                 if not response:
-                    view = self.views.get(request.endpoint)
-                    if not view:
-                        view = self.views.get('default')
-                    if not view:
+                    invoker = self.invokers.get(request.endpoint)
+                    if not invoker:
+                        invoker = self.invokers.get('default')
+                    if not invoker:
                         response = NotFound()
 
             if not response:
                 try:
-                    response = call_with_supported_params(view, request, **request.params)
+                    response = invoker(request, request.params)
                     if not isinstance(response, Response):
                         response = Response(response)
                 except HTTPException:
                     raise
                 except Exception, exception:
-                    for mediator in reversed(mediators):
-                        response = mediator.mediate_exception(request, exception)
+                    for mediate_exception in self.exception_mediators:
+                        response = mediate_exception(request, exception)
                         if response:
                             break
                     else:
                         import traceback;traceback.print_exc()
                         response = InternalServerError()
 
-            for mediator in reversed(mediators):
-                response = mediator.mediate_response(request, response) or response
+            for mediate_response in self.response_mediators:
+                response = mediate_response(request, response) or response
 
             return response
 
         finally:
             request.unbind()
 
+    def _collect_mediator_methods(self, name, reverse=False):
+        methods = []
+        default = getattr(Mediator, name).im_func
+        for mediator in self.mediators:
+            method = getattr(mediator, name, None)
+            if method is not None and getattr(method, 'im_func', None) is not default:
+                methods.append(method)
+
+        if reverse:
+            methods.reverse()
+        return methods
+
     def _collect_views(self, targets):
         views = {}
         for target in (targets or []):
@@ -192,6 +354,23 @@ class Mediator(object):
     def mediate_response(self, request, response):
         return response
 
+def construct_invoker(view):
+    """Return a function which calls view with a request and those of the
+    given params which view accepts as arguments, inspecting view once
+    rather than on every call."""
+    target = view
+    if not (isfunction(view) or ismethod(view)):
+        target = view.__call__
+    arguments = frozenset(getargspec(target)[0])
+
+    def invoke(request, params):
+        supported = {}
+        for name, value in params.iteritems():
+            if name in arguments:
+                supported[name] = value
+        return view(request, **supported)
+    return invoke
+
 def view(endpoint):
     if hasattr(endpoint, '__call__'):
         endpoint.__viewable__ = True
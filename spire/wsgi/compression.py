@@ -0,0 +1,202 @@
+import zlib
+
+from scheme import Boolean, Integer, Sequence, Text
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
+
+from spire.core import Configuration, Unit, configured_property
+from spire.wsgi.util import Middleware
+
+ENCODINGS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+EXCLUDED_TYPES = ['application/gzip', 'application/octet-stream', 'application/pdf',
+    'application/x-bzip2', 'application/x-gzip', 'application/zip', 'audio/',
+    'font/woff', 'image/', 'video/']
+
+class CompressionMiddleware(Unit, Middleware):
+    """A response compression middleware.
+
+    Responses are compressed with gzip or deflate, as negotiated through the
+    request's Accept-Encoding header, as the application produces them.
+    Responses which are smaller than minimum_size, which already have a
+    Content-Encoding or whose Content-Type matches an entry (or, for entries
+    ending in '/', a major type) of excluded_types are left alone.
+    """
+
+    configuration = Configuration({
+        'enabled': Boolean(default=True, required=True),
+        'level': Integer(minimum=1, maximum=9, default=6, required=True),
+        'minimum_size': Integer(minimum=0, default=1024, required=True),
+        'excluded_types': Sequence(Text(nonempty=True), unique=True,
+            default=EXCLUDED_TYPES),
+    })
+
+    enabled = configured_property('enabled')
+
+    def __init__(self, level, minimum_size, excluded_types=None):
+        self.level = level
+        self.minimum_size = minimum_size
+
+        self.excluded_types = set()
+        self.excluded_major_types = set()
+        for content_type in (excluded_types or ()):
+            if content_type.endswith('/'):
+                self.excluded_major_types.add(content_type[:-1])
+            else:
+                self.excluded_types.add(content_type)
+
+    def dispatch(self, application, environ, start_response):
+        encoding = None
+        if self.enabled and environ.get('REQUEST_METHOD') != 'HEAD':
+            encoding = self._negotiate_encoding(environ)
+        if not encoding:
+            return application(environ, start_response)
+
+        response = CompressedResponse(self, encoding, start_response)
+        iterable = application(environ, response.start_response)
+        return ClosingIterator(response.compress(iterable),
+            getattr(iterable, 'close', None))
+
+    def is_compressible(self, status, headers):
+        try:
+            code = int(status.split(None, 1)[0])
+        except ValueError:
+            return False
+        if code < 200 or code in (204, 206, 304):
+            return False
+
+        content_type = None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return False
+            elif name == 'cache-control' and 'no-transform' in value.lower():
+                return False
+            elif name == 'content-type':
+                content_type = value.split(';', 1)[0].strip().lower()
+            elif name == 'content-length':
+                try:
+                    if int(value) < self.minimum_size:
+                        return False
+                except ValueError:
+                    return False
+
+        if content_type:
+            if content_type in self.excluded_types:
+                return False
+            if content_type.split('/', 1)[0] in self.excluded_major_types:
+                return False
+        return True
+
+    def _negotiate_encoding(self, environ):
+        header = environ.get('HTTP_ACCEPT_ENCODING')
+        if not header:
+            return
+
+        accepted = parse_accept_header(header)
+        encoding, quality = None, 0
+        for candidate in ('gzip', 'deflate'):
+            candidate_quality = accepted[candidate]
+            if candidate_quality > quality:
+                encoding, quality = candidate, candidate_quality
+        return encoding
+
+class CompressedResponse(object):
+    """The state of a single response passing through a CompressionMiddleware.
+
+    The wrapped start_response is deferred until it is known whether the
+    response will be compressed: immediately for responses which declare
+    their length or cannot be compressed, and otherwise once minimum_size
+    bytes of the body have been produced (or the body has ended).
+    """
+
+    def __init__(self, middleware, encoding, start_response):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.wrapped_start_response = start_response
+        self.compressor = None
+        self.deferred = None
+        self.started = False
+        self.write = None
+
+    def start_response(self, status, headers, exc_info=None):
+        if self.started:
+            return self.wrapped_start_response(status, headers, exc_info)
+
+        self.compressor = None
+        if not self.middleware.is_compressible(status, headers):
+            return self._start(status, headers, exc_info)
+
+        for name, value in headers:
+            if name.lower() == 'content-length':
+                self._start_compressing(status, headers, exc_info)
+                break
+        else:
+            self.deferred = (status, headers, exc_info)
+        return self._write
+
+    def compress(self, iterable):
+        minimum_size = self.middleware.minimum_size
+        buffered, size = [], 0
+
+        for chunk in iterable:
+            if self.deferred:
+                buffered.append(chunk)
+                size += len(chunk)
+                if size < minimum_size:
+                    yield ''
+                    continue
+
+                self._start_compressing(*self.deferred)
+                chunk, buffered = ''.join(buffered), []
+
+            if self.compressor:
+                yield self.compressor.compress(chunk)
+            else:
+                yield chunk
+
+        if self.deferred:
+            self._start(*self.deferred)
+            yield ''.join(buffered)
+        elif self.compressor:
+            yield self.compressor.flush()
+
+    def _start(self, status, headers, exc_info=None):
+        self.deferred = None
+        self.started = True
+        self.write = self.wrapped_start_response(status, headers, exc_info)
+        return self.write
+
+    def _start_compressing(self, status, headers, exc_info=None):
+        self.compressor = zlib.compressobj(self.middleware.level, zlib.DEFLATED,
+            ENCODINGS[self.encoding])
+
+        vary = None
+        modified = []
+        for name, value in headers:
+            lowered = name.lower()
+            if lowered == 'content-length':
+                continue
+            elif lowered == 'vary':
+                vary = value
+                if value.strip() != '*' and 'accept-encoding' not in value.lower():
+                    value += ', Accept-Encoding'
+            elif lowered == 'etag' and not value.startswith('W/'):
+                value = 'W/' + value
+            modified.append((name, value))
+
+        if vary is None:
+            modified.append(('Vary', 'Accept-Encoding'))
+        modified.append(('Content-Encoding', self.encoding))
+        return self._start(status, modified, exc_info)
+
+    def _write(self, data):
+        # The application is using the legacy write() callable: a deferred
+        # response goes out uncompressed, and anything else is flushed through
+        # the compressor as it is written.
+        if self.deferred:
+            self._start(*self.deferred)
+        elif self.compressor:
+            data = (self.compressor.compress(data)
+                + self.compressor.flush(zlib.Z_SYNC_FLUSH))
+        return self.write(data)
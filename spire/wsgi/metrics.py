@@ -0,0 +1,80 @@
+import logging
+import re
+
+from spire.wsgi.server import Histogram
+from spire.wsgi.util import Mount
+
+if not hasattr(logging, 'statistics'):
+    logging.statistics = {}
+
+QUANTILES = (('0.5', 50), ('0.95', 95), ('0.99', 99))
+
+class Metrics(Mount):
+    """A mount which serves the contents of logging.statistics, including
+    the request timings of any wsgi server in this process, as text metrics."""
+
+    def dispatch(self, environ, start_response):
+        body = render_statistics(logging.statistics)
+        start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4'),
+            ('Content-Length', str(len(body)))])
+        return [body]
+
+def render_statistics(statistics):
+    """Render a statistics dict, mapping namespaces to dicts of stats, as
+    lines of text metrics. Callable stats are evaluated, nested dicts become
+    metrics labeled with their keys and histograms become summaries."""
+    lines = []
+    for namespace, stats in sorted(statistics.iteritems()):
+        _render_stats(lines, stats, '', [('namespace', namespace)])
+
+    if lines:
+        lines.append('')
+    return '\n'.join(lines)
+
+def _metric_name(key):
+    return re.sub(r'[^a-z0-9]+', '_', key.lower()).strip('_')
+
+def _format_labels(labels):
+    return ','.join('%s="%s"' % (name, _escape(value)) for name, value in labels)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    elif isinstance(value, float):
+        return repr(value)
+    else:
+        return str(int(value))
+
+def _render_stats(lines, stats, prefix, labels):
+    for key, value in sorted(stats.iteritems()):
+        name = prefix + _metric_name(key)
+        if callable(value):
+            try:
+                value = value(stats)
+            except Exception:
+                continue
+
+        if isinstance(value, dict):
+            for subkey, subvalue in sorted(value.iteritems()):
+                sublabels = labels + [('name', subkey)]
+                if isinstance(subvalue, dict):
+                    _render_stats(lines, subvalue, name + '_', sublabels)
+                else:
+                    _render_value(lines, name, sublabels, subvalue)
+        else:
+            _render_value(lines, name, labels, value)
+
+def _render_value(lines, name, labels, value):
+    if isinstance(value, Histogram):
+        for quantile, percent in QUANTILES:
+            quantile_labels = _format_labels(labels + [('quantile', quantile)])
+            lines.append('%s{%s} %s' % (name, quantile_labels,
+                _format_value(value.percentile(percent))))
+        labels = _format_labels(labels)
+        lines.append('%s_count{%s} %d' % (name, labels, value.count))
+        lines.append('%s_sum{%s} %r' % (name, labels, value.total))
+    elif isinstance(value, (int, long, float)):
+        lines.append('%s{%s} %s' % (name, _format_labels(labels), _format_value(value)))
@@ -69,14 +69,17 @@ number of requests and their responses, so we run a nested loop::
 """
 
 __all__ = ['HTTPRequest', 'HTTPConnection', 'HTTPServer',
-           'SizeCheckWrapper', 'KnownLengthRFile', 'ChunkedRFile',
-           'CP_fileobject',
+           'SizeCheckWrapper', 'HeadReader', 'KnownLengthRFile',
+           'ChunkedRFile', 'SpooledRFile', 'BufferPool', 'CP_fileobject',
            'MaxSizeExceeded', 'NoSSLError', 'FatalSSLAlert',
-           'WorkerThread', 'ThreadPool', 'SSLAdapter',
+           'Histogram', 'WorkerThread', 'ThreadPool', 'ConnectionMonitor', 'EventLoop',
+           'SSLAdapter',
            'CherryPyWSGIServer',
            'Gateway', 'WSGIGateway', 'WSGIGateway_10', 'WSGIGateway_u0',
+           'FileWrapper',
            'WSGIPathInfoDispatcher', 'get_ssl_adapter_class']
 
+import bisect
 import os
 try:
     import queue
@@ -84,8 +87,12 @@ except:
     import Queue as queue
 import re
 import rfc822
+import select
+import signal
 import socket
+import subprocess
 import sys
+from tempfile import SpooledTemporaryFile
 if 'win' in sys.platform and not hasattr(socket, 'IPPROTO_IPV6'):
     socket.IPPROTO_IPV6 = 41
 try:
@@ -99,6 +106,15 @@ _fileobject_uses_str_type = isinstance(socket._fileobject(None)._rbuf, basestrin
 import threading
 import time
 import traceback
+
+try:
+    from os import sendfile
+except ImportError:
+    try:
+        from sendfile import sendfile
+    except ImportError:
+        sendfile = None
+
 def format_exc(limit=None):
     """Like print_exc() but return a string. Backport for Python 2.3."""
     try:
@@ -177,13 +193,28 @@ socket_errors_to_ignore.append("The read operation timed out")
 socket_errors_nonblocking = plat_specific_errors(
     'EAGAIN', 'EWOULDBLOCK', 'WSAEWOULDBLOCK')
 
-comma_separated_headers = [ntob(h) for h in
+SO_REUSEPORT = getattr(socket, 'SO_REUSEPORT', None)
+if SO_REUSEPORT is None and sys.platform.startswith('linux'):
+    # Older Pythons lack the constant although Linux 3.9+ supports it.
+    SO_REUSEPORT = 15
+
+TCP_DEFER_ACCEPT = getattr(socket, 'TCP_DEFER_ACCEPT', None)
+
+comma_separated_headers = frozenset([ntob(h) for h in
     ['Accept', 'Accept-Charset', 'Accept-Encoding',
      'Accept-Language', 'Accept-Ranges', 'Allow', 'Cache-Control',
      'Connection', 'Content-Encoding', 'Content-Language', 'Expect',
      'If-Match', 'If-None-Match', 'Pragma', 'Proxy-Authenticate', 'TE',
      'Trailer', 'Transfer-Encoding', 'Upgrade', 'Vary', 'Via', 'Warning',
-     'WWW-Authenticate']]
+     'WWW-Authenticate']])
+
+header_names = {}
+"""A cache mapping header names as sent by clients to their interned,
+title-cased form, so that common headers share a single string."""
+
+max_header_names = 512
+"""The maximum number of entries in header_names; names seen after the
+cache is full are normalized but not cached."""
 
 
 import logging
@@ -226,9 +257,13 @@ def read_headers(rfile, hdict=None):
             except ValueError:
                 raise ValueError("Illegal header line.")
             # TODO: what about TE and WWW-Authenticate?
-            k = k.strip().title()
+            hname = header_names.get(k)
+            if hname is None:
+                hname = intern(k.strip().title())
+                if len(header_names) < max_header_names:
+                    header_names[k] = hname
+            k = hname
             v = v.strip()
-            hname = k
 
         if k in comma_separated_headers:
             existing = hdict.get(hname)
@@ -242,6 +277,10 @@ def read_headers(rfile, hdict=None):
 class MaxSizeExceeded(Exception):
     pass
 
+class ChunkSizeExceeded(MaxSizeExceeded, IOError):
+    """Raised by ChunkedRFile when a chunk would take the entity over its
+    maximum size; an IOError, as it has always been, and MaxSizeExceeded."""
+
 class SizeCheckWrapper(object):
     """Wraps a file-like object, raising MaxSizeExceeded if too large."""
 
@@ -311,6 +350,71 @@ class SizeCheckWrapper(object):
         return data
 
 
+class HeadReader(object):
+    """Reads the lines of a request head directly from a connection's socket.
+
+    Data is received into a reusable buffer with recv_into() and each line
+    is sliced from a single string per receive, instead of being pulled
+    through the file object 256 bytes at a time. Like SizeCheckWrapper,
+    MaxSizeExceeded is raised once more than maxlen bytes have been read.
+    Whatever was received beyond the head is handed back to the file object
+    by release(), where the request body (or the next request) is read from.
+    """
+
+    def __init__(self, rfile, bufsize):
+        self.rfile = rfile
+        self.buffer = bytearray(bufsize)
+        self.view = memoryview(self.buffer)
+        self.data = EMPTY
+        self.pos = 0
+        self.maxlen = 0
+        self.bytes_read = 0
+
+    def begin(self, maxlen):
+        """Prepare to read a new request head of at most maxlen bytes."""
+        self.maxlen = maxlen
+        self.bytes_read = 0
+        self.data = self.rfile.take_buffered_data()
+        self.pos = 0
+        return self
+
+    def release(self):
+        """Return any data received beyond the head to the file object."""
+        if self.pos < len(self.data):
+            self.rfile.unread(self.data[self.pos:])
+        self.data = EMPTY
+        self.pos = 0
+
+    def readline(self):
+        data, pos = self.data, self.pos
+        while True:
+            end = data.find(LF, pos)
+            if end >= 0:
+                end += 1
+                break
+            if self.maxlen and self.bytes_read + len(data) - pos > self.maxlen:
+                raise MaxSizeExceeded()
+            if not self.receive():
+                end = len(data)
+                break
+            data, pos = self.data, 0
+
+        self.pos = end
+        self.bytes_read += end - pos
+        if self.maxlen and self.bytes_read > self.maxlen:
+            raise MaxSizeExceeded()
+        return data[pos:end]
+
+    def receive(self):
+        size = self.rfile.recv_into(self.buffer)
+        if size:
+            received = self.view[:size].tobytes()
+            if self.pos < len(self.data):
+                received = self.data[self.pos:] + received
+            self.data, self.pos = received, 0
+        return size
+
+
 class KnownLengthRFile(object):
     """Wraps a file-like object, returning an empty string when exhausted."""
 
@@ -342,6 +446,20 @@ class KnownLengthRFile(object):
         self.remaining -= len(data)
         return data
 
+    def readinto(self, b):
+        """Read into the writable buffer b until it is full or the entity is
+        exhausted, returning the number of bytes read."""
+        if self.remaining == 0:
+            return 0
+
+        view = memoryview(b)
+        if len(view) > self.remaining:
+            view = view[:self.remaining]
+
+        size = self.rfile.readinto(view)
+        self.remaining -= size
+        return size
+
     def readlines(self, sizehint=0):
         # Shamelessly stolen from StringIO
         total = 0
@@ -379,14 +497,28 @@ class ChunkedRFile(object):
         self.rfile = rfile
         self.maxlen = maxlen
         self.bytes_read = 0
-        self.buffer = EMPTY
+        self.remaining = 0
+        self.started = False
         self.bufsize = bufsize
         self.closed = False
 
     def _fetch(self):
+        """Start reading the next chunk, returning False at the last one.
+
+        Chunk data is read directly from self.rfile as it is requested, with
+        self.remaining tracking what is left of the current chunk.
+        """
         if self.closed:
-            return
+            return False
 
+        if self.started:
+            crlf = self.rfile.read(2)
+            if crlf != CRLF:
+                raise ValueError(
+                     "Bad chunked transfer coding (expected '\\r\\n', "
+                     "got " + repr(crlf) + ")")
+
+        self.started = True
         line = self.rfile.readline()
         self.bytes_read += len(line)
 
@@ -403,70 +535,67 @@ class ChunkedRFile(object):
 
         if chunk_size <= 0:
             self.closed = True
-            return
+            return False
 
 ##            if line: chunk_extension = line[0]
 
         if self.maxlen and self.bytes_read + chunk_size > self.maxlen:
-            raise IOError("Request Entity Too Large")
+            raise ChunkSizeExceeded("Request Entity Too Large")
 
-        chunk = self.rfile.read(chunk_size)
-        self.bytes_read += len(chunk)
-        self.buffer += chunk
+        self.bytes_read += chunk_size
+        self.remaining = chunk_size
+        return True
 
-        crlf = self.rfile.read(2)
-        if crlf != CRLF:
-            raise ValueError(
-                 "Bad chunked transfer coding (expected '\\r\\n', "
-                 "got " + repr(crlf) + ")")
+    def _consumed(self, size):
+        if size:
+            self.remaining -= size
+        else:
+            # The connection closed mid-chunk; _fetch() will complain.
+            self.remaining = 0
 
     def read(self, size=None):
-        data = EMPTY
-        while True:
-            if size and len(data) >= size:
-                return data
-
-            if not self.buffer:
-                self._fetch()
-                if not self.buffer:
-                    # EOF
-                    return data
-
-            if size:
-                remaining = size - len(data)
-                data += self.buffer[:remaining]
-                self.buffer = self.buffer[remaining:]
-            else:
-                data += self.buffer
+        if size is None or size < 0:
+            size = -1
+
+        chunks = []
+        while size and (self.remaining or self._fetch()):
+            data = self.rfile.read(self.remaining if size < 0
+                                   else min(size, self.remaining))
+            self._consumed(len(data))
+            if data:
+                chunks.append(data)
+                if size > 0:
+                    size -= len(data)
+        return EMPTY.join(chunks)
 
     def readline(self, size=None):
-        data = EMPTY
-        while True:
-            if size and len(data) >= size:
-                return data
-
-            if not self.buffer:
-                self._fetch()
-                if not self.buffer:
-                    # EOF
-                    return data
-
-            newline_pos = self.buffer.find(LF)
-            if size:
-                if newline_pos == -1:
-                    remaining = size - len(data)
-                    data += self.buffer[:remaining]
-                    self.buffer = self.buffer[remaining:]
-                else:
-                    remaining = min(size - len(data), newline_pos)
-                    data += self.buffer[:remaining]
-                    self.buffer = self.buffer[remaining:]
-            else:
-                if newline_pos == -1:
-                    data += self.buffer
-                else:
-                    data += self.buffer[:newline_pos]
-                    self.buffer = self.buffer[newline_pos:]
+        if size is None or size < 0:
+            size = -1
+
+        chunks = []
+        while size and (self.remaining or self._fetch()):
+            data = self.rfile.readline(self.remaining if size < 0
+                                       else min(size, self.remaining))
+            self._consumed(len(data))
+            if data:
+                chunks.append(data)
+                if size > 0:
+                    size -= len(data)
+                if data[-1:] == LF:
+                    break
+        return EMPTY.join(chunks)
+
+    def readinto(self, b):
+        """Read into the writable buffer b until it is full or the entity is
+        exhausted, returning the number of bytes read."""
+        view = memoryview(b)
+        filled = 0
+        while filled < len(view) and (self.remaining or self._fetch()):
+            size = self.rfile.readinto(
+                view[filled:filled + min(len(view) - filled, self.remaining)])
+            self._consumed(size)
+            filled += size
+        return filled
 
     def readlines(self, sizehint=0):
         # Shamelessly stolen from StringIO
@@ -508,15 +637,21 @@ class ChunkedRFile(object):
         self.rfile.close()
 
     def __iter__(self):
-        # Shamelessly stolen from StringIO
-        total = 0
-        line = self.readline(sizehint)
+        line = self.readline()
         while line:
             yield line
-            total += len(line)
-            if 0 < sizehint <= total:
-                break
-            line = self.readline(sizehint)
+            line = self.readline()
+
+
+class SpooledRFile(SpooledTemporaryFile):
+    """A request body read in full from the connection, held in memory up to
+    max_size bytes and in a temporary file on disk beyond that."""
+
+    def readinto(self, b):
+        view = memoryview(b)
+        data = self.read(len(view))
+        view[:len(data)] = data
+        return len(data)
 
 
 class HTTPRequest(object):
@@ -558,6 +693,7 @@ class HTTPRequest(object):
 
         self.ready = False
         self.started_request = False
+        self.start_time = None
         self.scheme = ntob("http")
         if self.server.ssl_adapter is not None:
             self.scheme = ntob("https")
@@ -574,8 +710,28 @@ class HTTPRequest(object):
 
     def parse_request(self):
         """Parse the next HTTP request start-line and message-headers."""
-        self.rfile = SizeCheckWrapper(self.conn.rfile,
-                                      self.server.max_request_header_size)
+        deadline = self.set_deadline(self.server.header_timeout)
+        reader = self.conn.get_head_reader()
+        try:
+            if reader is None:
+                self.rfile = SizeCheckWrapper(self.conn.rfile,
+                                              self.server.max_request_header_size)
+                self.read_head()
+            else:
+                self.rfile = reader.begin(self.server.max_request_header_size)
+                try:
+                    self.read_head()
+                finally:
+                    reader.release()
+        finally:
+            if deadline:
+                self.conn.rfile.set_deadline(0)
+
+        if self.ready and self.start_time is not None:
+            self.server.timings['Parse'].record(time.time() - self.start_time)
+
+    def read_head(self):
+        """Read the request line and headers from self.rfile."""
         try:
             success = self.read_request_line()
         except MaxSizeExceeded:
@@ -615,6 +771,8 @@ class HTTPRequest(object):
         self.started_request = True
         if not request_line:
             return False
+        if self.server.stats['Enabled']:
+            self.start_time = time.time()
 
         if request_line == CRLF:
             # RFC 2616 sec 4.1: "...if the server is reading the protocol
@@ -828,13 +986,60 @@ class HTTPRequest(object):
                 return
             self.rfile = KnownLengthRFile(self.conn.rfile, cl)
 
-        self.server.gateway(self).respond()
+        deadline = False
+        if self.chunked_read or cl:
+            deadline = self.set_deadline(self.server.body_timeout)
+        try:
+            if self.server.spool_threshold and (self.chunked_read or cl):
+                if not self.spool_body():
+                    return
+
+            self.server.gateway(self).respond()
 
-        if (self.ready and not self.sent_headers):
-            self.sent_headers = True
-            self.send_headers()
-        if self.chunked_write:
-            self.conn.wfile.sendall("0\r\n\r\n")
+            if (self.ready and not self.sent_headers):
+                self.sent_headers = True
+                self.send_headers()
+            if self.chunked_write:
+                self.conn.wfile.sendall("0\r\n\r\n")
+        finally:
+            if deadline:
+                self.conn.rfile.set_deadline(0)
+            if isinstance(self.rfile, SpooledRFile):
+                self.rfile.close()
+
+    def set_deadline(self, timeout):
+        """Set a deadline of timeout seconds (extended according to the
+        server's minimum_rate) on reading from the connection, returning
+        True if one was set."""
+        set_deadline = getattr(self.conn.rfile, 'set_deadline', None)
+        if not timeout or set_deadline is None:
+            return False
+        set_deadline(timeout, self.server.minimum_rate)
+        return True
+
+    def spool_body(self):
+        """Read the whole request body into a SpooledRFile, which replaces
+        self.rfile. Returns False if the body was too large."""
+        spool = SpooledRFile(max_size=self.server.spool_threshold)
+        block = buffer_pool.acquire()
+        try:
+            size = self.rfile.readinto(block)
+            while size:
+                spool.write(buffer(block, 0, size))
+                size = self.rfile.readinto(block)
+        except MaxSizeExceeded:
+            spool.close()
+            if not self.sent_headers:
+                self.simple_response("413 Request Entity Too Large",
+                    "The entity sent with the request exceeds the maximum "
+                    "allowed bytes.")
+            return False
+        finally:
+            buffer_pool.release(block)
+
+        spool.seek(0)
+        self.rfile = spool
+        return True
 
     def simple_response(self, status, msg=""):
         """Write a simple response back to the client."""
@@ -873,15 +1078,16 @@ class HTTPRequest(object):
     def write(self, chunk):
         """Write unbuffered data to the client."""
         if self.chunked_write and chunk:
-            buf = [hex(len(chunk))[2:], CRLF, chunk, CRLF]
-            self.conn.wfile.sendall(EMPTY.join(buf))
+            self.conn.wfile.sendall("%x\r\n%s\r\n" % (len(chunk), chunk))
         else:
             self.conn.wfile.sendall(chunk)
 
-    def send_headers(self):
+    def send_headers(self, body=None):
         """Assert, process, and send the HTTP response message-headers.
 
         You must set self.status, and self.outheaders before calling this.
+        If given, body is sent (chunk-encoded if necessary) in the same
+        write as the headers.
         """
         hkeys = [key.lower() for key, value in self.outheaders]
         status = int(self.status[:3])
@@ -930,7 +1136,12 @@ class HTTPRequest(object):
             # badly broken client implementations."
             remaining = getattr(self.rfile, 'remaining', 0)
             if remaining > 0:
-                self.rfile.read(remaining)
+                buffer = buffer_pool.acquire()
+                try:
+                    while self.rfile.readinto(buffer):
+                        pass
+                finally:
+                    buffer_pool.release(buffer)
 
         if "date" not in hkeys:
             self.outheaders.append(("Date", rfc822.formatdate()))
@@ -942,6 +1153,11 @@ class HTTPRequest(object):
         for k, v in self.outheaders:
             buf.append(k + COLON + SPACE + v + CRLF)
         buf.append(CRLF)
+        if body:
+            if self.chunked_write:
+                buf.append("%x\r\n%s\r\n" % (len(body), body))
+            else:
+                buf.append(body)
         self.conn.wfile.sendall(EMPTY.join(buf))
 
 
@@ -955,23 +1171,92 @@ class FatalSSLAlert(Exception):
     pass
 
 
+class BufferPool(object):
+    """A pool of reusable bytearrays, each of the same size.
+
+    Buffers are handed out by acquire() and should be given back with
+    release(); at most limit idle buffers are kept.
+    """
+
+    def __init__(self, size=65536, limit=32):
+        self.size = size
+        self.limit = limit
+        self.buffers = []
+
+    def acquire(self):
+        try:
+            return self.buffers.pop()
+        except IndexError:
+            return bytearray(self.size)
+
+    def release(self, buffer):
+        if len(self.buffers) < self.limit:
+            self.buffers.append(buffer)
+
+buffer_pool = BufferPool()
+"""The BufferPool shared by the connections of every server in the process."""
+
+
 class CP_fileobject(socket._fileobject):
     """Faux file object attached to a socket object."""
 
+    deadline = None
+    """The seconds which reads may spend waiting for data on the socket, or
+    None. It is extended by a second for every deadline_rate bytes read."""
+
+    deadline_rate = 0
+
     def __init__(self, *args, **kwargs):
         self.bytes_read = 0
         self.bytes_written = 0
         socket._fileobject.__init__(self, *args, **kwargs)
 
+    def set_deadline(self, timeout, rate=0):
+        """Require the data read from now on to be received within timeout
+        seconds, plus a second for every rate bytes of it. Only the time
+        spent waiting on the socket counts, not the time between reads,
+        which the application may spend processing what it has read. A
+        timeout of 0 removes the deadline."""
+        if timeout:
+            self._timeout = self._sock.gettimeout()
+            self._deadline_bytes = self.bytes_read
+            self._deadline_waited = 0
+            self.deadline = timeout
+            self.deadline_rate = rate
+        else:
+            self.deadline = None
+
+    def _apply_deadline(self):
+        """Raise socket.timeout if the deadline has passed, or lower the
+        socket's timeout to what remains of it, returning True if so."""
+        deadline = self.deadline
+        if self.deadline_rate:
+            deadline += (self.bytes_read - self._deadline_bytes) / float(self.deadline_rate)
+
+        remaining = deadline - self._deadline_waited
+        if remaining <= 0:
+            raise socket.timeout("timed out")
+        if self._timeout is None or remaining < self._timeout:
+            self._sock.settimeout(remaining)
+            return True
+        return False
+
     def sendall(self, data):
         """Sendall for non-blocking sockets."""
         while data:
             try:
                 bytes_sent = self.send(data)
-                data = data[bytes_sent:]
             except socket.error, e:
                 if e.args[0] not in socket_errors_nonblocking:
                     raise
+                continue
+            if bytes_sent >= len(data):
+                break
+            if type(self._sock) is socket.socket:
+                # Avoid copying the remainder for every partial send.
+                data = memoryview(data)[bytes_sent:]
+            else:
+                data = data[bytes_sent:]
 
     def send(self, data):
         bytes_sent = self._sock.send(data)
@@ -984,8 +1269,39 @@ class CP_fileobject(socket._fileobject):
             self._wbuf = []
             self.sendall(buffer)
 
+    def has_buffered_data(self):
+        """Return True if data already received from the socket is unread."""
+        if _fileobject_uses_str_type:
+            return bool(self._rbuf)
+        self._rbuf.seek(0, 2)
+        return self._rbuf.tell() > 0
+
+    def take_buffered_data(self):
+        """Remove and return any data received from the socket but unread."""
+        if _fileobject_uses_str_type:
+            data, self._rbuf = self._rbuf, EMPTY
+            return data
+        data = self._rbuf.getvalue()
+        if data:
+            self._rbuf = StringIO.StringIO()
+        return data
+
+    def unread(self, data):
+        """Push data back onto the front of the read buffer."""
+        if _fileobject_uses_str_type:
+            self._rbuf = data + self._rbuf
+            return
+        rest = self._rbuf.getvalue()
+        self._rbuf = StringIO.StringIO()
+        self._rbuf.write(data)
+        if rest:
+            self._rbuf.write(rest)
+
     def recv(self, size):
         while True:
+            waiting = self.deadline is not None
+            if waiting:
+                lowered, started = self._apply_deadline(), time.time()
             try:
                 data = self._sock.recv(size)
                 self.bytes_read += len(data)
@@ -994,6 +1310,51 @@ class CP_fileobject(socket._fileobject):
                 if (e.args[0] not in socket_errors_nonblocking
                     and e.args[0] not in socket_error_eintr):
                     raise
+            finally:
+                if waiting:
+                    self._deadline_waited += time.time() - started
+                    if lowered:
+                        self._sock.settimeout(self._timeout)
+
+    def recv_into(self, buffer):
+        while True:
+            waiting = self.deadline is not None
+            if waiting:
+                lowered, started = self._apply_deadline(), time.time()
+            try:
+                size = self._sock.recv_into(buffer)
+                self.bytes_read += size
+                return size
+            except socket.error, e:
+                if (e.args[0] not in socket_errors_nonblocking
+                    and e.args[0] not in socket_error_eintr):
+                    raise
+            finally:
+                if waiting:
+                    self._deadline_waited += time.time() - started
+                    if lowered:
+                        self._sock.settimeout(self._timeout)
+
+    def readinto(self, b):
+        """Read into the writable buffer b until it is full or the socket is
+        closed, returning the number of bytes read."""
+        view = memoryview(b)
+        size = len(view)
+
+        data = self.take_buffered_data()
+        filled = min(len(data), size)
+        if filled:
+            if filled < len(data):
+                self.unread(data[filled:])
+                data = data[:filled]
+            view[:filled] = data
+
+        while filled < size:
+            received = self.recv_into(view[filled:])
+            if not received:
+                break
+            filled += received
+        return filled
 
     if not _fileobject_uses_str_type:
         def read(self, size=-1):
@@ -1026,35 +1387,24 @@ class CP_fileobject(socket._fileobject):
                     self._rbuf.write(buf.read())
                     return rv
 
-                self._rbuf = StringIO.StringIO()  # reset _rbuf.  we consume it via buf.
-                while True:
-                    left = size - buf_len
-                    # recv() will malloc the amount of memory given as its
-                    # parameter even though it often returns much less data
-                    # than that.  The returned data string is short lived
-                    # as we copy it into a StringIO and free it.  This avoids
-                    # fragmentation issues on many platforms.
-                    data = self.recv(left)
-                    if not data:
-                        break
-                    n = len(data)
-                    if n == size and not buf_len:
-                        # Shortcut.  Avoid buffer data copies when:
-                        # - We have no data in our buffer.
-                        # AND
-                        # - Our call to recv returned exactly the
-                        #   number of bytes we were asked to read.
-                        return data
-                    if n == left:
-                        buf.write(data)
-                        del data  # explicit free
-                        break
-                    assert n <= left, "recv(%d) returned %d bytes" % (left, n)
-                    buf.write(data)
-                    buf_len += n
-                    del data  # explicit free
-                    #assert buf_len == buf.tell()
-                return buf.getvalue()
+                # Receive the rest directly into one buffer (pooled, unless
+                # the read is large) rather than calling recv(), which would
+                # allocate the amount left for every call, and copying each
+                # piece through a StringIO.
+                pooled = (size <= buffer_pool.size)
+                if pooled:
+                    buffer = buffer_pool.acquire()
+                else:
+                    buffer = bytearray(size)
+                try:
+                    view = memoryview(buffer)
+                    n = self.readinto(view[:size])
+                    if n == len(buffer):
+                        return str(buffer)
+                    return view[:n].tobytes()
+                finally:
+                    if pooled:
+                        buffer_pool.release(buffer)
 
         def readline(self, size=-1):
             buf = self._rbuf
@@ -1270,6 +1620,20 @@ class HTTPConnection(object):
     wbufsize = DEFAULT_BUFFER_SIZE
     RequestHandlerClass = HTTPRequest
 
+    parked = False
+    """True once this connection has been handed to the server's
+    ConnectionMonitor between keep-alive requests."""
+
+    head_buffer_size = 8192
+    """The size of the buffer request heads are received into, allocated
+    once per connection. If 0, heads are read line by line through rfile."""
+
+    head_reader = None
+
+    environ = None
+    """The environ entries which are the same for every request on this
+    connection, cached by the gateway."""
+
     def __init__(self, server, sock, makefile=CP_fileobject):
         self.server = server
         self.socket = sock
@@ -1277,9 +1641,24 @@ class HTTPConnection(object):
         self.wfile = makefile(sock, "wb", self.wbufsize)
         self.requests_seen = 0
 
+    def get_head_reader(self):
+        """Return the HeadReader for this connection, or None if request heads
+        must be read through rfile (for SSL or custom file objects)."""
+        reader = self.head_reader
+        if reader is None and self.head_buffer_size:
+            if (self.server.ssl_adapter is None
+                and isinstance(self.rfile, CP_fileobject)):
+                reader = self.head_reader = HeadReader(self.rfile,
+                    self.head_buffer_size)
+        return reader
+
     def communicate(self):
-        """Read each request and respond appropriately."""
-        request_seen = False
+        """Read each request and respond appropriately.
+
+        Returns True if the connection is idle but still open and should be
+        parked until the client sends its next request.
+        """
+        request_seen = self.parked
         try:
             while True:
                 # (re)set req to None so that if something goes wrong in
@@ -1290,8 +1669,7 @@ class HTTPConnection(object):
 
                 # This order of operations should guarantee correct pipelining.
                 req.parse_request()
-                if self.server.stats['Enabled']:
-                    self.requests_seen += 1
+                self.requests_seen += 1
                 if not req.ready:
                     # Something went wrong in the parsing (and the server has
                     # probably already made a simple_response). Return and
@@ -1302,6 +1680,8 @@ class HTTPConnection(object):
                 req.respond()
                 if req.close_connection:
                     return
+                if self.can_park():
+                    return True
         except socket.error:
             e = sys.exc_info()[1]
             errnum = e.args[0]
@@ -1353,6 +1733,17 @@ class HTTPConnection(object):
                     # Close the connection.
                     return
 
+    def can_park(self):
+        """Return True if this idle connection can wait in the monitor.
+
+        Pipelined requests which are already buffered must be served first,
+        since the monitor only notices new data arriving on the socket.
+        """
+        if self.server.monitor is None:
+            return False
+        has_buffered_data = getattr(self.rfile, 'has_buffered_data', None)
+        return has_buffered_data is not None and not has_buffered_data()
+
     linger = False
 
     def close(self):
@@ -1387,8 +1778,92 @@ class TrueyZero(object):
 trueyzero = TrueyZero()
 
 
+latency_buckets = tuple([1e-5 * 2 ** (i / 4.0) for i in range(89)])
+"""The upper bounds, in seconds, of the buckets of a latency Histogram:
+from 10 microseconds to about 42 seconds, each about 19% wider than the
+last."""
+
+class Histogram(object):
+    """A fixed-bucket histogram of latencies, in seconds.
+
+    Recording a value is a bisection and a few increments, without a lock;
+    a concurrent update may very occasionally be lost, which does not
+    matter for a latency distribution. Percentiles are estimated as the
+    upper bound of the bucket they fall in (or the largest value recorded,
+    for the last bucket).
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'maximum')
+
+    def __init__(self, bounds=latency_buckets):
+        self.bounds = bounds
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, percent):
+        """Return the estimated value below which percent of values fall,
+        or None if nothing has been recorded."""
+        count = self.count
+        if not count:
+            return None
+
+        threshold = count * percent / 100.0
+        cumulative = 0
+        for i, bucket in enumerate(self.counts):
+            cumulative += bucket
+            if bucket and cumulative >= threshold:
+                if i < len(self.bounds):
+                    return min(self.bounds[i], self.maximum)
+                break
+        return self.maximum
+
+    def summary(self):
+        """Return a dict with the count, sum, p50, p95 and p99 of the values."""
+        return {'count': self.count, 'sum': self.total,
+                'p50': self.percentile(50), 'p95': self.percentile(95),
+                'p99': self.percentile(99)}
+
+
 _SHUTDOWNREQUEST = None
 
+class Counters(object):
+    """Request, byte and work time counts for a worker thread.
+
+    Only the owning thread updates its counters, so they are kept without a
+    lock and always on; they are summed across threads only when a snapshot
+    is taken.
+    """
+
+    __slots__ = ('requests', 'bytes_read', 'bytes_written', 'work_time')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.work_time = 0.0
+
+    def add(self, other):
+        self.requests += other.requests
+        self.bytes_read += other.bytes_read
+        self.bytes_written += other.bytes_written
+        self.work_time += other.work_time
+
+
 class WorkerThread(threading.Thread):
     """Thread which continuously polls a Queue for Connection objects.
 
@@ -1414,23 +1889,34 @@ class WorkerThread(threading.Thread):
         self.ready = False
         self.server = server
 
-        self.requests_seen = 0
-        self.bytes_read = 0
-        self.bytes_written = 0
+        self.counters = Counters()
         self.start_time = None
-        self.work_time = 0
         self.stats = {
-            'Requests': lambda s: self.requests_seen + ((self.start_time is None) and trueyzero or self.conn.requests_seen),
-            'Bytes Read': lambda s: self.bytes_read + ((self.start_time is None) and trueyzero or self.conn.rfile.bytes_read),
-            'Bytes Written': lambda s: self.bytes_written + ((self.start_time is None) and trueyzero or self.conn.wfile.bytes_written),
-            'Work Time': lambda s: self.work_time + ((self.start_time is None) and trueyzero or time.time() - self.start_time),
+            'Requests': lambda s: self.snapshot().requests,
+            'Bytes Read': lambda s: self.snapshot().bytes_read,
+            'Bytes Written': lambda s: self.snapshot().bytes_written,
+            'Work Time': lambda s: self.snapshot().work_time,
             'Read Throughput': lambda s: s['Bytes Read'](s) / (s['Work Time'](s) or 1e-6),
             'Write Throughput': lambda s: s['Bytes Written'](s) / (s['Work Time'](s) or 1e-6),
         }
         threading.Thread.__init__(self)
 
+    def snapshot(self):
+        """Return a copy of this thread's counters, including those of the
+        connection it is serving."""
+        counters = Counters()
+        counters.add(self.counters)
+        conn, start_time = self.conn, self.start_time
+        if conn is not None and start_time is not None:
+            counters.requests += conn.requests_seen
+            counters.bytes_read += conn.rfile.bytes_read
+            counters.bytes_written += conn.wfile.bytes_written
+            counters.work_time += time.time() - start_time
+        return counters
+
     def run(self):
         self.server.stats['Worker Threads'][self.getName()] = self.stats
+        counters = self.counters
         try:
             self.ready = True
             while True:
@@ -1439,19 +1925,32 @@ class WorkerThread(threading.Thread):
                     return
 
                 self.conn = conn
-                if self.server.stats['Enabled']:
-                    self.start_time = time.time()
+                self.start_time = start_time = time.time()
+                parked = False
                 try:
-                    conn.communicate()
+                    parked = conn.communicate()
                 finally:
-                    conn.close()
-                    if self.server.stats['Enabled']:
-                        self.requests_seen += self.conn.requests_seen
-                        self.bytes_read += self.conn.rfile.bytes_read
-                        self.bytes_written += self.conn.wfile.bytes_written
-                        self.work_time += time.time() - self.start_time
-                        self.start_time = None
+                    if not parked:
+                        conn.close()
+                    # Clear start_time first, so a concurrent snapshot may
+                    # briefly miss this connection but never counts it twice.
+                    self.start_time = None
+                    counters.requests += conn.requests_seen
+                    counters.bytes_read += conn.rfile.bytes_read
+                    counters.bytes_written += conn.wfile.bytes_written
+                    counters.work_time += time.time() - start_time
                     self.conn = None
+                    if parked:
+                        # The connection comes back to a worker later, so
+                        # reset its counters to avoid counting them twice.
+                        conn.requests_seen = 0
+                        conn.rfile.bytes_read = 0
+                        conn.wfile.bytes_written = 0
+                        monitor = self.server.monitor
+                        if monitor is not None:
+                            monitor.park(conn)
+                        else:
+                            conn.close()
         except (KeyboardInterrupt, SystemExit):
             exc = sys.exc_info()[1]
             self.server.interrupt = exc
@@ -1462,15 +1961,29 @@ class ThreadPool(object):
 
     ThreadPool objects must provide min, get(), put(obj), start()
     and stop(timeout) attributes.
+
+    If max is greater than min, a controller thread samples the queue depth,
+    the number of idle threads and the time connections wait in the queue,
+    growing the pool toward max while connections wait longer than
+    target_wait and shrinking it back toward min once threads have been
+    idle for idle_timeout seconds. The counters of threads which exit are
+    folded into retired, so snapshot() covers the life of the pool.
     """
 
-    def __init__(self, server, min=10, max=-1):
+    control_interval = .5
+    """The interval, in seconds, between samples taken by the controller."""
+
+    def __init__(self, server, min=10, max=-1, target_wait=.1, idle_timeout=10):
         self.server = server
         self.min = min
         self.max = max
+        self.target_wait = target_wait
+        self.idle_timeout = idle_timeout
+        self.wait_time = 0
+        self.retired = Counters()
         self._threads = []
         self._queue = queue.Queue()
-        self.get = self._queue.get
+        self._controller = None
 
     def start(self):
         """Start the pool of threads."""
@@ -1483,16 +1996,41 @@ class ThreadPool(object):
             while not worker.ready:
                 time.sleep(.1)
 
+        if self.max > self.min:
+            self._controller = threading.Thread(target=self._control)
+            self._controller.setName("CP Server Controller")
+            self._controller.setDaemon(True)
+            self._controller.start()
+
     def _get_idle(self):
         """Number of worker threads which are idle. Read-only."""
         return len([t for t in self._threads if t.conn is None])
     idle = property(_get_idle, doc=_get_idle.__doc__)
 
+    def get(self):
+        """Return the next queued object, recording how long it waited."""
+        queued, obj = self._queue.get()
+        if obj is not _SHUTDOWNREQUEST:
+            # An exponentially weighted moving average, updated without a
+            # lock; a lost update only delays the controller slightly.
+            wait = time.time() - queued
+            self.wait_time += (wait - self.wait_time) * .2
+            if self.server.stats['Enabled']:
+                self.server.timings['Queue'].record(wait)
+        return obj
+
     def put(self, obj):
-        self._queue.put(obj)
+        self._queue.put((time.time(), obj))
         if obj is _SHUTDOWNREQUEST:
             return
 
+    def put_many(self, objs):
+        """Queue several objects accepted together, with the same queued
+        time."""
+        now, queue = time.time(), self._queue
+        for obj in objs:
+            queue.put((now, obj))
+
     def grow(self, amount):
         """Spawn new worker threads (not above self.max)."""
         for i in range(amount):
@@ -1507,10 +2045,9 @@ class ThreadPool(object):
         """Kill off worker threads (not below self.min)."""
         # Grow/shrink the pool if necessary.
         # Remove any dead threads from our list
-        for t in self._threads:
-            if not t.isAlive():
-                self._threads.remove(t)
-                amount -= 1
+        count = len(self._threads)
+        self._cull()
+        amount -= count - len(self._threads)
 
         if amount > 0:
             for i in range(min(amount, len(self._threads) - self.min)):
@@ -1518,13 +2055,52 @@ class ThreadPool(object):
                 # to 'amount'. Once each of those is processed by a worker,
                 # that worker will terminate and be culled from our list
                 # in self.put.
-                self._queue.put(_SHUTDOWNREQUEST)
+                self.put(_SHUTDOWNREQUEST)
+
+    def _get_oldest_wait(self):
+        """The time the oldest queued object has been waiting. Read-only."""
+        try:
+            queued, obj = self._queue.queue[0]
+        except IndexError:
+            return 0
+        return time.time() - queued
+    oldest_wait = property(_get_oldest_wait, doc=_get_oldest_wait.__doc__)
+
+    def _control(self):
+        idle_since = None
+        while self._controller is not None:
+            time.sleep(self.control_interval)
+            if self._controller is None:
+                return
+
+            # Cull threads retired by an earlier shrink.
+            self._cull()
+
+            qsize, idle = self.qsize, self.idle
+            if qsize and not idle:
+                idle_since = None
+                wait = max(self.wait_time, self.oldest_wait)
+                if wait > self.target_wait:
+                    self.grow(qsize)
+            elif idle > 1 and not qsize:
+                now = time.time()
+                if idle_since is None:
+                    idle_since = now
+                elif now - idle_since >= self.idle_timeout:
+                    self.shrink(idle // 2)
+                    idle_since = now
+            else:
+                idle_since = None
 
     def stop(self, timeout=5):
+        controller, self._controller = self._controller, None
+        if controller is not None and controller is not threading.currentThread():
+            controller.join()
+
         # Must shut down threads here so the code that calls
         # this method can know when all threads are stopped.
         for worker in self._threads:
-            self._queue.put(_SHUTDOWNREQUEST)
+            self.put(_SHUTDOWNREQUEST)
 
         # Don't join currentThread (when stop is called inside a request).
         current = threading.currentThread()
@@ -1556,12 +2132,311 @@ class ThreadPool(object):
                         # See http://www.cherrypy.org/ticket/691.
                         KeyboardInterrupt):
                     pass
+            self._retire(worker)
+
+    def _cull(self):
+        """Remove threads which have exited from the pool."""
+        threads, retired = [], []
+        for worker in self._threads:
+            if worker.isAlive():
+                threads.append(worker)
+            else:
+                retired.append(worker)
+
+        # Replace the list before folding in the retired threads' counters,
+        # so that a concurrent snapshot never counts them twice.
+        self._threads = threads
+        for worker in retired:
+            self._retire(worker)
+
+    def _retire(self, worker):
+        self.retired.add(worker.counters)
+        self.server.stats['Worker Threads'].pop(worker.getName(), None)
+
+    def snapshot(self):
+        """Return the counters of every worker thread, past and present,
+        summed into a single Counters."""
+        counters = Counters()
+        counters.add(self.retired)
+        for worker in self._threads[:]:
+            counters.add(worker.snapshot())
+        return counters
+
+    def clear_counters(self):
+        """Reset the counters of every worker thread and register them with
+        the server's (newly cleared) stats."""
+        self.retired.reset()
+        for worker in self._threads[:]:
+            worker.counters.reset()
+            self.server.stats['Worker Threads'][worker.getName()] = worker.stats
 
     def _get_qsize(self):
         return self._queue.qsize()
     qsize = property(_get_qsize)
 
 
+class Poller(object):
+    """Wait for readability on a set of file descriptors (epoll or poll)."""
+
+    available = hasattr(select, 'epoll') or hasattr(select, 'poll')
+    """False on platforms (such as Windows) which provide neither."""
+
+    def __init__(self):
+        if hasattr(select, 'epoll'):
+            self._poller = select.epoll()
+            self._flags = select.EPOLLIN | select.EPOLLPRI
+            self._scale = 1
+        else:
+            self._poller = select.poll()
+            self._flags = select.POLLIN | select.POLLPRI
+            self._scale = 1000
+
+    def register(self, fd):
+        self._poller.register(fd, self._flags)
+
+    def unregister(self, fd):
+        try:
+            self._poller.unregister(fd)
+        except (IOError, OSError, KeyError, ValueError):
+            # The descriptor was already closed.
+            pass
+
+    def poll(self, timeout):
+        """Return the registered descriptors which are ready to be read."""
+        try:
+            return [fd for fd, event in self._poller.poll(timeout * self._scale)]
+        except (select.error, IOError, OSError):
+            x = sys.exc_info()[1]
+            if x.args[0] in socket_error_eintr:
+                return []
+            raise
+
+    def close(self):
+        if hasattr(self._poller, 'close'):
+            self._poller.close()
+
+
+class ConnectionMonitor(threading.Thread):
+    """Thread which holds idle keep-alive connections off the worker pool.
+
+    Rather than blocking a WorkerThread in readline() until the client sends
+    its next request, a connection which has finished a response is parked
+    here. The monitor watches all parked sockets at once, receives the next
+    request head as it arrives and puts a connection back onto the server's
+    request queue only once the head is complete. Connections which stay
+    idle for longer than the server's timeout, or whose request head is not
+    complete by the server's header_timeout, are closed.
+    """
+
+    sweep_interval = 1
+    """The interval in seconds between checks for expired connections."""
+
+    max_head_size = 65536
+    """The number of bytes of an incomplete request head after which its
+    connection is handed to a worker thread regardless (which will then
+    usually reject it as too large)."""
+
+    receive_size = 8192
+    """The maximum number of bytes received for a connection at a time."""
+
+    def __init__(self, server):
+        self.server = server
+        self.connections = {}
+        self.heads = {}
+        self.incoming = []
+        self.guard = threading.Lock()
+        self.ready = False
+        threading.Thread.__init__(self)
+        self.setName("CP Server Monitor")
+        self.setDaemon(True)
+
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        for fd in (self._wakeup_read, self._wakeup_write):
+            prevent_socket_inheritance(fd)
+        fcntl.fcntl(self._wakeup_write, fcntl.F_SETFL, os.O_NONBLOCK)
+
+    def park(self, conn):
+        """Watch the given idle connection until the client sends a request."""
+        if not self.ready:
+            conn.close()
+            return
+
+        conn.parked = True
+        with self.guard:
+            self.incoming.append(conn)
+        self._wakeup()
+
+    def stop(self):
+        """Stop the monitor and close every connection it holds."""
+        self.ready = False
+        self._wakeup()
+        if self.isAlive() and self is not threading.currentThread():
+            self.join()
+
+    def run(self):
+        poller = Poller()
+        poller.register(self._wakeup_read)
+        self._prepare(poller)
+
+        self.ready = True
+        next_sweep = time.time() + self.sweep_interval
+        try:
+            while self.ready:
+                self._accept_incoming(poller)
+                for fd in poller.poll(self.sweep_interval):
+                    if fd == self._wakeup_read:
+                        os.read(fd, 4096)
+                    elif fd in self.connections:
+                        self._readable(poller, fd)
+                    else:
+                        self._event(poller, fd)
+
+                now = time.time()
+                if now >= next_sweep:
+                    self._expire(poller, now)
+                    next_sweep = now + self.sweep_interval
+        finally:
+            self.ready = False
+            self._accept_incoming(poller)
+            for fd, (conn, deadline) in self.connections.items():
+                conn.close()
+            self.connections.clear()
+            poller.close()
+            with self.guard:
+                os.close(self._wakeup_read)
+                os.close(self._wakeup_write)
+                self._wakeup_write = None
+
+    def _prepare(self, poller):
+        pass
+
+    def _event(self, poller, fd):
+        pass
+
+    def _readable(self, poller, fd):
+        conn, deadline = self.connections[fd]
+        try:
+            data = conn.rfile.recv(self.receive_size)
+        except socket.error:
+            data = EMPTY
+        if not data:
+            self._discard(poller, fd)
+            conn.close()
+            return
+
+        head, started = self.heads.pop(fd, (EMPTY, None))
+        head += data
+        if len(head) < self.max_head_size and not head_is_complete(head):
+            server = self.server
+            if started is None:
+                started = time.time()
+            if server.header_timeout:
+                deadline = started + server.header_timeout
+                if server.minimum_rate:
+                    deadline += len(head) / float(server.minimum_rate)
+                self.connections[fd] = (conn, deadline)
+            self.heads[fd] = (head, started)
+            return
+
+        self._discard(poller, fd)
+        conn.rfile.unread(head)
+        self.server.requests.put(conn)
+
+    def _accept_incoming(self, poller):
+        with self.guard:
+            incoming, self.incoming = self.incoming, []
+
+        for conn in incoming:
+            self._watch(poller, conn)
+
+    def _watch(self, poller, conn):
+        try:
+            fd = conn.socket.fileno()
+        except socket.error:
+            conn.close()
+            return
+        self.connections[fd] = (conn, time.time() + self.server.timeout)
+        poller.register(fd)
+
+    def _discard(self, poller, fd):
+        self.heads.pop(fd, None)
+        conn, deadline = self.connections.pop(fd)
+        poller.unregister(fd)
+        return conn
+
+    def _expire(self, poller, now):
+        for fd, (conn, deadline) in self.connections.items():
+            if deadline <= now:
+                if fd in self.heads:
+                    # The client started a request but was too slow to
+                    # finish sending its head.
+                    try:
+                        request = conn.RequestHandlerClass(self.server, conn)
+                        request.simple_response("408 Request Timeout")
+                    except (socket.error, FatalSSLAlert):
+                        pass
+                self._discard(poller, fd)
+                conn.close()
+
+    def _wakeup(self):
+        with self.guard:
+            if self._wakeup_write is None:
+                return
+            try:
+                os.write(self._wakeup_write, "x")
+            except OSError:
+                # The pipe is full, which means a wakeup is already pending.
+                pass
+
+
+class EventLoop(ConnectionMonitor):
+    """The event loop at the core of the server's 'event' engine.
+
+    Instead of a thread blocking in accept() and worker threads blocking
+    until each request head arrives, the event loop runs in the thread
+    which starts the server and watches the listening socket and every
+    connection at once. New connections are accepted and then treated like
+    parked ones: their request heads are received as data arrives, and a
+    connection is put on the request queue only once its request head is
+    complete, so that worker threads only run the application and write
+    its response.
+    """
+
+    def __init__(self, server):
+        ConnectionMonitor.__init__(self, server)
+        self.setName("CP Server Event Loop")
+        self.listener = None
+
+    def _prepare(self, poller):
+        # Accepting happens only when the poller says a connection is
+        # waiting, which another process sharing the socket may take first.
+        self.server.socket.setblocking(0)
+        self.listener = self.server.socket.fileno()
+        poller.register(self.listener)
+
+    def _event(self, poller, fd):
+        if fd != self.listener or not self.server.ready:
+            return
+
+        try:
+            conns = self.server.accept_many(self.server.accept_batch or 64,
+                queued=False)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.server.error_log("Error in EventLoop accept",
+                level=logging.ERROR, traceback=True)
+            return
+        for conn in conns:
+            self._watch(poller, conn)
+
+
+def head_is_complete(head):
+    """Return True if the given data holds a complete request head, after
+    any empty lines left over from a previous request."""
+    head = head.lstrip(CRLF)
+    return (LF + CRLF) in head or (LF + LF) in head
+
 
 try:
     import fcntl
@@ -1587,8 +2462,11 @@ except ImportError:
                 raise WinError()
 else:
     def prevent_socket_inheritance(sock):
-        """Mark the given socket fd as non-inheritable (POSIX)."""
-        fd = sock.fileno()
+        """Mark the given socket (or raw fd) as non-inheritable (POSIX)."""
+        if isinstance(sock, int):
+            fd = sock
+        else:
+            fd = sock.fileno()
         old_flags = fcntl.fcntl(fd, fcntl.F_GETFD)
         fcntl.fcntl(fd, fcntl.F_SETFD, old_flags | fcntl.FD_CLOEXEC)
 
@@ -1647,6 +2525,20 @@ class HTTPServer(object):
     timeout = 10
     """The timeout in seconds for accepted connections (default 10)."""
 
+    header_timeout = 0
+    """The time, in seconds, within which a client must send a whole request
+    head once it has begun (or, for a worker waiting on a connection, once it
+    starts waiting), or 0 for no limit. Slower clients get a 408 response."""
+
+    body_timeout = 0
+    """The time, in seconds, within which a client must send a whole request
+    body, or 0 for no limit. Slower clients get a 408 response."""
+
+    minimum_rate = 0
+    """A transfer rate, in bytes per second, which extends header_timeout and
+    body_timeout by a second for every this many bytes received, so that
+    large requests from clients which keep sending are not cut off."""
+
     version = "CherryPy/3.2.2"
     """A version string for the HTTPServer."""
 
@@ -1664,9 +2556,80 @@ class HTTPServer(object):
     max_request_body_size = 0
     """The maximum size, in bytes, for request bodies, or 0 for no limit."""
 
+    max_queue_size = 0
+    """The maximum number of accepted connections waiting for a worker
+    thread, or 0 for no limit. Beyond it, new connections are shed."""
+
+    max_queue_wait = 0
+    """The maximum time, in seconds, the oldest queued connection may have
+    waited for a worker thread, or 0 for no limit. Beyond it, new
+    connections are shed."""
+
+    retry_after = 1
+    """The value of the Retry-After header sent to shed connections."""
+
+    spool_threshold = 0
+    """If nonzero, request bodies are read in full before the application is
+    called and given to it as a seekable wsgi.input, held in memory up to
+    this many bytes and spilled to a temporary file on disk beyond that."""
+
     nodelay = True
     """If True (the default since 3.1), sets the TCP_NODELAY socket option."""
 
+    accept_batch = 0
+    """If nonzero, the listening socket is made non-blocking and the accept
+    loop waits for it to become readable, then accepts up to this many
+    waiting connections in one pass and queues them together. This is
+    unavailable (and ignored) on platforms without epoll or poll. The event
+    engine always accepts in batches, of this many or 64 connections."""
+
+    defer_accept = 0
+    """If nonzero, sets the TCP_DEFER_ACCEPT socket option (where supported)
+    so that connections are only accepted once the client sends data, or
+    after this many seconds."""
+
+    response_buffer_size = 8192
+    """The size, in bytes, up to which response bodies are sent in the same
+    write as the response headers, or 0 to always write them separately.
+
+    Applications returning a list or tuple this small have their response
+    sent with a single write (and given a Content-Length if they lack one);
+    larger and iterator bodies are streamed."""
+
+    keepalive_parking = True
+    """If True (the default), idle keep-alive connections wait in a
+    ConnectionMonitor between requests instead of occupying a worker thread.
+    This is unavailable (and ignored) for SSL servers and on platforms
+    without epoll or poll."""
+
+    monitor = None
+    """The ConnectionMonitor holding idle connections, or None."""
+
+    _acceptor = None
+
+    engine = 'threaded'
+    """How connections are served: 'threaded' (the default), where a thread
+    accepts connections and worker threads read each request from its
+    connection, or 'event', where an EventLoop accepts connections and reads
+    request heads for all of them and worker threads only run the
+    application. The event engine is unavailable for SSL servers and on
+    platforms without epoll or poll, which fall back to 'threaded'."""
+
+    reuse_port = False
+    """If True, sets the SO_REUSEPORT socket option so that several processes
+    can each bind their own socket to the same address."""
+
+    multiprocess = False
+    """True if this server is one of several processes serving the same
+    application; reflected in the wsgi.multiprocess environ entry."""
+
+    environ = None
+    """The environ entries which are the same for every request to this
+    server, cached by the gateway and reset when the server starts."""
+
+    socket = None
+    """The listening socket, or None before prepare() is called."""
+
     ConnectionClass = HTTPConnection
     """The class to use for handling HTTP connections."""
 
@@ -1690,34 +2653,48 @@ class HTTPServer(object):
     def clear_stats(self):
         self._start_time = None
         self._run_time = 0
+        self.timings = {
+            'Queue': Histogram(),
+            'Parse': Histogram(),
+            'Application': Histogram(),
+            'Write': Histogram(),
+            }
         self.stats = {
             'Enabled': False,
             'Bind Address': lambda s: repr(self.bind_addr),
-            'Run time': lambda s: (not s['Enabled']) and -1 or self.runtime(),
+            'Run time': lambda s: self.runtime(),
             'Accepts': 0,
             'Accepts/sec': lambda s: s['Accepts'] / self.runtime(),
             'Queue': lambda s: getattr(self.requests, "qsize", None),
+            'Queue Wait': lambda s: getattr(self.requests, "wait_time", None),
             'Threads': lambda s: len(getattr(self.requests, "_threads", [])),
             'Threads Idle': lambda s: getattr(self.requests, "idle", None),
+            'Parked Connections': lambda s: len(getattr(self.monitor, "connections", ())),
             'Socket Errors': 0,
-            'Requests': lambda s: (not s['Enabled']) and -1 or sum([w['Requests'](w) for w
-                                       in s['Worker Threads'].values()], 0),
-            'Bytes Read': lambda s: (not s['Enabled']) and -1 or sum([w['Bytes Read'](w) for w
-                                         in s['Worker Threads'].values()], 0),
-            'Bytes Written': lambda s: (not s['Enabled']) and -1 or sum([w['Bytes Written'](w) for w
-                                            in s['Worker Threads'].values()], 0),
-            'Work Time': lambda s: (not s['Enabled']) and -1 or sum([w['Work Time'](w) for w
-                                         in s['Worker Threads'].values()], 0),
-            'Read Throughput': lambda s: (not s['Enabled']) and -1 or sum(
-                [w['Bytes Read'](w) / (w['Work Time'](w) or 1e-6)
-                 for w in s['Worker Threads'].values()], 0),
-            'Write Throughput': lambda s: (not s['Enabled']) and -1 or sum(
-                [w['Bytes Written'](w) / (w['Work Time'](w) or 1e-6)
-                 for w in s['Worker Threads'].values()], 0),
+            'Shed Connections': 0,
+            'Requests': lambda s: self.snapshot().requests,
+            'Bytes Read': lambda s: self.snapshot().bytes_read,
+            'Bytes Written': lambda s: self.snapshot().bytes_written,
+            'Work Time': lambda s: self.snapshot().work_time,
+            'Read Throughput': lambda s: s['Bytes Read'](s) / (s['Work Time'](s) or 1e-6),
+            'Write Throughput': lambda s: s['Bytes Written'](s) / (s['Work Time'](s) or 1e-6),
             'Worker Threads': {},
+            'Timings': self.timings,
             }
         logging.statistics["CherryPy HTTPServer %d" % id(self)] = self.stats
 
+        clear_counters = getattr(self.requests, "clear_counters", None)
+        if clear_counters is not None:
+            clear_counters()
+
+    def snapshot(self):
+        """Return the counters of the request queue's worker threads, summed
+        into a single Counters (empty if the queue keeps none)."""
+        snapshot = getattr(self.requests, "snapshot", None)
+        if snapshot is not None:
+            return snapshot()
+        return Counters()
+
     def runtime(self):
         if self._start_time is None:
             return self._run_time
@@ -1766,6 +2743,67 @@ class HTTPServer(object):
         # trap those exceptions in whatever code block calls start().
         self._interrupt = None
 
+        # The socket may already have been prepared, e.g. by a parent
+        # process which forks several servers sharing one listening socket.
+        if self.socket is None:
+            self.prepare()
+        self.environ = None
+
+        # Create worker threads
+        self.requests.start()
+
+        if self.accept_batch and self.engine != 'event' and Poller.available:
+            self.socket.setblocking(0)
+            self._acceptor = Poller()
+            self._acceptor.register(self.socket.fileno())
+
+        if self.ssl_adapter is None and Poller.available:
+            if self.engine == 'event':
+                self.monitor = EventLoop(self)
+            elif self.keepalive_parking:
+                self.monitor = ConnectionMonitor(self)
+                self.monitor.start()
+                while not self.monitor.ready:
+                    time.sleep(.1)
+
+        self.ready = True
+        self._start_time = time.time()
+        self._notify_ready()
+        if isinstance(self.monitor, EventLoop):
+            # The event loop accepts connections itself, in this thread,
+            # until the server is stopped.
+            self.monitor.run()
+            while self.interrupt is True:
+                time.sleep(0.1)
+            if self.interrupt:
+                raise self.interrupt
+
+        try:
+            while self.ready:
+                try:
+                    self.tick()
+                except (KeyboardInterrupt, SystemExit):
+                    raise
+                except:
+                    self.error_log("Error in HTTPServer.tick", level=logging.ERROR,
+                                   traceback=True)
+
+                if self.interrupt:
+                    while self.interrupt is True:
+                        # Wait for self.stop() to complete. See _set_interrupt.
+                        time.sleep(0.1)
+                    if self.interrupt:
+                        raise self.interrupt
+        finally:
+            acceptor, self._acceptor = self._acceptor, None
+            if acceptor is not None:
+                acceptor.close()
+
+    def _notify_ready(self):
+        """Called by start() once the server is ready to accept connections."""
+
+    def prepare(self):
+        """Create, bind and listen on the server socket."""
         if self.software is None:
             self.software = "%s Server" % self.version
 
@@ -1835,27 +2873,6 @@ class HTTPServer(object):
         self.socket.settimeout(1)
         self.socket.listen(self.request_queue_size)
 
-        # Create worker threads
-        self.requests.start()
-
-        self.ready = True
-        self._start_time = time.time()
-        while self.ready:
-            try:
-                self.tick()
-            except (KeyboardInterrupt, SystemExit):
-                raise
-            except:
-                self.error_log("Error in HTTPServer.tick", level=logging.ERROR,
-                               traceback=True)
-
-            if self.interrupt:
-                while self.interrupt is True:
-                    # Wait for self.stop() to complete. See _set_interrupt.
-                    time.sleep(0.1)
-                if self.interrupt:
-                    raise self.interrupt
-
     def error_log(self, msg="", level=20, traceback=False):
         # Override this in subclasses as desired
         sys.stderr.write(msg + '\n')
@@ -1870,8 +2887,16 @@ class HTTPServer(object):
         self.socket = socket.socket(family, type, proto)
         prevent_socket_inheritance(self.socket)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            if SO_REUSEPORT is None:
+                raise socket.error("SO_REUSEPORT is not supported on this platform")
+            self.socket.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
         if self.nodelay and not isinstance(self.bind_addr, str):
             self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if (self.defer_accept and TCP_DEFER_ACCEPT is not None
+            and not isinstance(self.bind_addr, basestring)):
+            self.socket.setsockopt(socket.IPPROTO_TCP, TCP_DEFER_ACCEPT,
+                self.defer_accept)
 
         if self.ssl_adapter is not None:
             self.socket = self.ssl_adapter.bind(self.socket)
@@ -1890,14 +2915,67 @@ class HTTPServer(object):
         self.socket.bind(self.bind_addr)
 
     def tick(self):
-        """Accept a new connection and put it on the Queue."""
+        """Accept new connections and put them on the Queue."""
+        if self._acceptor is not None:
+            if not self._acceptor.poll(1) or not self.ready:
+                return
+            conns = self.accept_many(self.accept_batch)
+            put_many = getattr(self.requests, "put_many", None)
+            if put_many is not None:
+                put_many(conns)
+            else:
+                for conn in conns:
+                    self.requests.put(conn)
+            return
+
+        conn = self.accept()
+        if conn is not None:
+            self.requests.put(conn)
+
+    def accept(self):
+        """Accept a new connection and return it, or None if there was none
+        to accept or it has already been dealt with (e.g. shed)."""
         try:
             s, addr = self.socket.accept()
-            if self.stats['Enabled']:
-                self.stats['Accepts'] += 1
-            if not self.ready:
-                return
+        except socket.timeout:
+            # The only reason for the timeout in start() is so we can
+            # notice keyboard interrupts on Win32, which don't interrupt
+            # accept() by default
+            return
+        except socket.error:
+            self._accept_failed()
+            return
+        return self.prepare_connection(s, addr)
+
+    def accept_many(self, limit, queued=True):
+        """Accept up to limit waiting connections from the (non-blocking)
+        listening socket, stopping early once none are waiting, and return
+        those not already dealt with. If queued is True, the connections are
+        bound for the request queue and count toward max_queue_size."""
+        conns = []
+        for i in range(limit):
+            try:
+                s, addr = self.socket.accept()
+            except socket.error:
+                x = sys.exc_info()[1]
+                if x.args[0] not in socket_errors_nonblocking:
+                    self._accept_failed()
+                break
 
+            conn = self.prepare_connection(s, addr, queued and len(conns) or 0)
+            if conn is not None:
+                conns.append(conn)
+        return conns
+
+    def prepare_connection(self, s, addr, pending=0):
+        """Wrap a newly accepted socket in a connection and return it, or
+        None if it has already been dealt with (e.g. shed). pending is the
+        number of connections accepted alongside it not yet queued."""
+        self.stats['Accepts'] += 1
+        if not self.ready:
+            return
+
+        try:
             prevent_socket_inheritance(s)
             if hasattr(s, 'settimeout'):
                 s.settimeout(self.timeout)
@@ -1949,31 +3027,68 @@ class HTTPServer(object):
 
             conn.ssl_env = ssl_env
 
-            self.requests.put(conn)
+            if self.overloaded(pending):
+                self.shed(conn)
+                return
+
+            return conn
         except socket.timeout:
-            # The only reason for the timeout in start() is so we can
-            # notice keyboard interrupts on Win32, which don't interrupt
-            # accept() by default
             return
+        except socket.error:
+            self._accept_failed()
+
+    def _accept_failed(self):
+        """Count the socket.error being handled, re-raising it (with its
+        traceback) unless the accept should simply be retried or the socket
+        has been closed."""
+        x = sys.exc_info()[1]
+        self.stats['Socket Errors'] += 1
+        if x.args[0] in socket_error_eintr:
+            # I *think* this is right. EINTR should occur when a signal
+            # is received during the accept() call; all docs say retry
+            # the call, and I *think* I'm reading it right that Python
+            # will then go ahead and poll for and handle the signal
+            # elsewhere. See http://www.cherrypy.org/ticket/707.
+            return
+        if x.args[0] in socket_errors_nonblocking:
+            # Just try again. See http://www.cherrypy.org/ticket/479.
+            return
+        if x.args[0] in socket_errors_to_ignore:
+            # Our socket was closed.
+            # See http://www.cherrypy.org/ticket/686.
+            return
+        raise
+
+    def overloaded(self, pending=0):
+        """Return True if new connections should be shed rather than queued,
+        given pending connections already accepted but not yet queued."""
+        requests = self.requests
+        if self.max_queue_size and requests.qsize + pending >= self.max_queue_size:
+            return True
+        if (self.max_queue_wait and
+            getattr(requests, "oldest_wait", 0) > self.max_queue_wait):
+            return True
+        return False
+
+    def shed(self, conn):
+        """Answer the given connection with 503 immediately and close it."""
+        self.stats['Shed Connections'] += 1
+
+        msg = "The server is overloaded; please retry later."
+        buf = ["%s 503 Service Unavailable\r\n" % self.protocol,
+               "Retry-After: %s\r\n" % self.retry_after,
+               "Connection: close\r\n",
+               "Content-Length: %s\r\n" % len(msg),
+               "Content-Type: text/plain\r\n\r\n",
+               msg]
+        try:
+            conn.wfile.sendall("".join(buf))
         except socket.error:
             x = sys.exc_info()[1]
-            if self.stats['Enabled']:
-                self.stats['Socket Errors'] += 1
-            if x.args[0] in socket_error_eintr:
-                # I *think* this is right. EINTR should occur when a signal
-                # is received during the accept() call; all docs say retry
-                # the call, and I *think* I'm reading it right that Python
-                # will then go ahead and poll for and handle the signal
-                # elsewhere. See http://www.cherrypy.org/ticket/707.
-                return
-            if x.args[0] in socket_errors_nonblocking:
-                # Just try again. See http://www.cherrypy.org/ticket/479.
-                return
-            if x.args[0] in socket_errors_to_ignore:
-                # Our socket was closed.
-                # See http://www.cherrypy.org/ticket/686.
-                return
-            raise
+            if x.args[0] not in socket_errors_to_ignore:
+                raise
+        finally:
+            conn.close()
 
     def _get_interrupt(self):
         return self._interrupt
@@ -2027,6 +3142,11 @@ class HTTPServer(object):
                 sock.close()
             self.socket = None
 
+        monitor = self.monitor
+        if monitor is not None:
+            self.monitor = None
+            monitor.stop()
+
         self.requests.stop(self.shutdown_timeout)
 
 
@@ -2120,9 +3240,24 @@ class WSGIGateway(Gateway):
 
     def respond(self):
         """Process the current request."""
+        timings = None
+        if self.req.server.stats['Enabled']:
+            timings = self.req.server.timings
+            started = time.time()
+
         response = self.req.server.wsgi_app(self.env, self.start_response)
+        if timings is not None:
+            called = time.time()
+            timings['Application'].record(called - started)
         try:
-            for chunk in response:
+            chunks = response
+            if isinstance(response, FileWrapper):
+                if self.can_sendfile(response):
+                    chunks = self.sendfile(response)
+            elif isinstance(response, (list, tuple)):
+                if self.send_buffered(response):
+                    chunks = ()
+            for chunk in chunks:
                 # "The start_response callable must not actually transmit
                 # the response headers. Instead, it must store them for the
                 # server or gateway to transmit only after the first
@@ -2136,6 +3271,115 @@ class WSGIGateway(Gateway):
         finally:
             if hasattr(response, "close"):
                 response.close()
+            if timings is not None:
+                timings['Write'].record(time.time() - called)
+
+    def send_buffered(self, response):
+        """Send a small list or tuple response with its headers in one write.
+
+        Returns False, having sent nothing, if the response is too large or
+        the headers have already been sent.
+        """
+        req = self.req
+        size = req.server.response_buffer_size
+        if not size or not self.started_response or req.sent_headers:
+            return False
+
+        chunks, total = [], 0
+        for chunk in response:
+            if isinstance(chunk, unicodestr):
+                chunk = chunk.encode('ISO-8859-1')
+            total += len(chunk)
+            if total > size:
+                return False
+            chunks.append(chunk)
+
+        rbo = self.remaining_bytes_out
+        if rbo is None:
+            # The whole body is known, so declare its length rather than
+            # falling back to the chunked transfer-coding.
+            status = int(req.status[:3])
+            if (req.method != 'HEAD' and status >= 200
+                and status not in (204, 205, 304)):
+                req.outheaders.append(("Content-Length", str(total)))
+        elif total > rbo:
+            # Let write() report the excess.
+            return False
+
+        req.sent_headers = True
+        req.send_headers(EMPTY.join(chunks))
+        return True
+
+    def can_sendfile(self, wrapper):
+        """Return True if the given FileWrapper can be sent with sendfile.
+
+        This requires a sendfile implementation, a plain (not SSL) socket
+        with a timeout, a declared Content-Length (so the output is not
+        chunked) and a file-like object with a real file descriptor.
+        """
+        req = self.req
+        if (sendfile is None or req.server.ssl_adapter is not None
+            or not self.started_response or self.remaining_bytes_out is None):
+            return False
+        if type(req.conn.socket) is not socket.socket:
+            return False
+        if req.conn.socket.gettimeout() == 0:
+            return False
+        try:
+            wrapper.filelike.fileno()
+        except (AttributeError, IOError, ValueError):
+            return False
+        return True
+
+    def sendfile(self, wrapper):
+        """Send the body of a FileWrapper straight from its file descriptor.
+
+        Returns an iterable over whatever remains to be sent, which is empty
+        unless sendfile is unsupported for this file and the rest must be
+        sent through buffered reads.
+        """
+        req = self.req
+        if not req.sent_headers:
+            req.sent_headers = True
+            req.send_headers()
+
+        filelike = wrapper.filelike
+        fd = filelike.fileno()
+        try:
+            offset = filelike.tell()
+        except (AttributeError, IOError):
+            offset = os.lseek(fd, 0, os.SEEK_CUR)
+
+        sock = req.conn.socket
+        out, timeout = sock.fileno(), sock.gettimeout()
+        remaining = self.remaining_bytes_out
+        while remaining > 0:
+            try:
+                sent = sendfile(out, fd, offset, remaining)
+            except (IOError, OSError), e:
+                if e.errno in socket_errors_nonblocking:
+                    # The socket buffer is full; wait for it to drain.
+                    if not select.select([], [out], [], timeout)[1]:
+                        raise socket.timeout("timed out")
+                    continue
+                elif e.errno in socket_error_eintr:
+                    continue
+                elif e.errno in (errno.EPIPE, errno.ECONNRESET):
+                    raise socket.error(e.errno, e.strerror)
+                # This file can't be sent with sendfile, so fall back to
+                # buffered reads from where sendfile left off.
+                filelike.seek(offset)
+                return wrapper
+            if not sent:
+                # The file is shorter than the declared Content-Length, and
+                # the client would otherwise wait for the missing bytes.
+                req.close_connection = True
+                raise ValueError(
+                    "Response body is shorter than the declared Content-Length.")
+            offset += sent
+            remaining -= sent
+            req.conn.wfile.bytes_written += sent
+        return ()
 
     def start_response(self, status, headers, exc_info = None):
         """WSGI callable to begin the HTTP response."""
@@ -2191,9 +3435,13 @@ class WSGIGateway(Gateway):
 
         if not self.req.sent_headers:
             self.req.sent_headers = True
-            self.req.send_headers()
-
-        self.req.write(chunk)
+            if chunklen <= self.req.server.response_buffer_size:
+                self.req.send_headers(chunk)
+            else:
+                self.req.send_headers()
+                self.req.write(chunk)
+        else:
+            self.req.write(chunk)
 
         if rbo is not None:
             rbo -= chunklen
@@ -2202,59 +3450,92 @@ class WSGIGateway(Gateway):
                     "Response body exceeds the declared Content-Length.")
 
 
+header_environ_keys = {}
+"""A cache mapping header names to their interned environ keys."""
+
+def header_environ_key(name):
+    """Return the environ key for the named request header."""
+    key = "HTTP_" + name.upper().replace("-", "_")
+    if key in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
+        key = key[5:]
+
+    key = intern(key)
+    if len(header_environ_keys) < max_header_names:
+        header_environ_keys[name] = key
+    return key
+
+
 class WSGIGateway_10(WSGIGateway):
     """A Gateway class to interface HTTPServer with WSGI 1.0.x."""
 
     def get_environ(self):
         """Return a new environ dict targeting the given wsgi.version"""
         req = self.req
+        env = req.conn.environ
+        if env is None:
+            env = req.conn.environ = self.get_connection_environ()
+
+        env = env.copy()
+        env['PATH_INFO'] = req.path
+        env['QUERY_STRING'] = req.qs
+        env['REQUEST_METHOD'] = req.method
+        env['REQUEST_URI'] = req.uri
+        # Bah. "SERVER_PROTOCOL" is actually the REQUEST protocol.
+        env['SERVER_PROTOCOL'] = req.request_protocol
+        env['wsgi.input'] = req.rfile
+        env['wsgi.url_scheme'] = req.scheme
+
+        # Request headers, including CONTENT_TYPE/CONTENT_LENGTH
+        keys = header_environ_keys
+        for k, v in req.inheaders.iteritems():
+            key = keys.get(k)
+            if key is None:
+                key = header_environ_key(k)
+            env[key] = v
+
+        if req.conn.ssl_env:
+            env.update(req.conn.ssl_env)
+
+        return env
+
+    def get_connection_environ(self):
+        """Return the environ entries shared by every request on the
+        connection, starting from those shared by the whole server."""
+        req = self.req
+        env = req.server.environ
+        if env is None:
+            env = req.server.environ = self.get_server_environ()
+
+        env = env.copy()
+        env['REMOTE_ADDR'] = req.conn.remote_addr or ''
+        env['REMOTE_PORT'] = str(req.conn.remote_port or '')
+        return env
+
+    def get_server_environ(self):
+        """Return the environ entries shared by every request to the server."""
+        server = self.req.server
         env = {
             # set a non-standard environ entry so the WSGI app can know what
             # the *real* server protocol is (and what features to support).
             # See http://www.faqs.org/rfcs/rfc2145.html.
-            'ACTUAL_SERVER_PROTOCOL': req.server.protocol,
-            'PATH_INFO': req.path,
-            'QUERY_STRING': req.qs,
-            'REMOTE_ADDR': req.conn.remote_addr or '',
-            'REMOTE_PORT': str(req.conn.remote_port or ''),
-            'REQUEST_METHOD': req.method,
-            'REQUEST_URI': req.uri,
+            'ACTUAL_SERVER_PROTOCOL': server.protocol,
             'SCRIPT_NAME': '',
-            'SERVER_NAME': req.server.server_name,
-            # Bah. "SERVER_PROTOCOL" is actually the REQUEST protocol.
-            'SERVER_PROTOCOL': req.request_protocol,
-            'SERVER_SOFTWARE': req.server.software,
+            'SERVER_NAME': server.server_name,
+            'SERVER_SOFTWARE': server.software,
             'wsgi.errors': sys.stderr,
-            'wsgi.input': req.rfile,
-            'wsgi.multiprocess': False,
+            'wsgi.file_wrapper': FileWrapper,
+            'wsgi.multiprocess': server.multiprocess,
             'wsgi.multithread': True,
             'wsgi.run_once': False,
-            'wsgi.url_scheme': req.scheme,
             'wsgi.version': (1, 0),
             }
 
-        if isinstance(req.server.bind_addr, basestring):
+        if isinstance(server.bind_addr, basestring):
             # AF_UNIX. This isn't really allowed by WSGI, which doesn't
             # address unix domain sockets. But it's better than nothing.
             env["SERVER_PORT"] = ""
         else:
-            env["SERVER_PORT"] = str(req.server.bind_addr[1])
-
-        # Request headers
-        for k, v in req.inheaders.iteritems():
-            env["HTTP_" + k.upper().replace("-", "_")] = v
-
-        # CONTENT_TYPE/CONTENT_LENGTH
-        ct = env.pop("HTTP_CONTENT_TYPE", None)
-        if ct is not None:
-            env["CONTENT_TYPE"] = ct
-        cl = env.pop("HTTP_CONTENT_LENGTH", None)
-        if cl is not None:
-            env["CONTENT_LENGTH"] = cl
-
-        if req.conn.ssl_env:
-            env.update(req.conn.ssl_env)
-
+            env["SERVER_PORT"] = str(server.bind_addr[1])
         return env
 
 
@@ -2289,6 +3570,30 @@ class WSGIGateway_u0(WSGIGateway_10):
 
         return env
 
+class FileWrapper(object):
+    """The wsgi.file_wrapper: iterates over a file-like object in blocks.
+
+    WSGIGateway recognises this wrapper and, where possible, transmits the
+    file with sendfile rather than iterating over it.
+    """
+
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+        if hasattr(filelike, 'close'):
+            self.close = filelike.close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = self.filelike.read(self.blksize)
+        if data:
+            return data
+        raise StopIteration
+
+    next = __next__
+
 wsgi_gateways = {
     (1, 0): WSGIGateway_10,
     ('u', 0): WSGIGateway_u0,
@@ -2331,8 +3636,57 @@ class WSGIPathInfoDispatcher(object):
 
 # ----- spire additions -----
 
+LISTEN_FD_VARIABLE = 'SPIRE_LISTEN_FD'
+"""The environment variable through which a listening socket is handed to a
+new server process, as a file descriptor number."""
+
+READY_PID_VARIABLE = 'SPIRE_READY_PID'
+"""The environment variable naming the process to send SIGUSR1 to once a new
+server process is ready to serve."""
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit()
+
+def describe_exit_status(status):
+    """Describe how a process exited, given its status from os.waitpid()."""
+    if os.WIFSIGNALED(status):
+        return "was killed by signal %d" % os.WTERMSIG(status)
+    return "exited with status %d" % os.WEXITSTATUS(status)
+
+def rerun_command():
+    """Return the command which started this process, as a list of arguments,
+    rerunning a module with -m if it was started that way. Interpreter
+    options other than -m are not preserved."""
+    package = getattr(sys.modules.get('__main__'), '__package__', None)
+    if package is None or not sys.argv or sys.argv[0] in ('', '-c'):
+        return [sys.executable] + sys.argv
+
+    module = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    if package:
+        module = package if module == '__main__' else '%s.%s' % (package, module)
+    return [sys.executable, '-m', module] + sys.argv[1:]
+
 class WsgiServer(CherryPyWSGIServer):
-    def __init__(self, address, application, numthreads=10, timeout=10):
+    respawn_delay = 1
+    """The minimum interval, in seconds, between restarts of a worker process."""
+
+    kill_timeout = 5
+    """The time, in seconds, which worker processes are given to exit on top
+    of shutdown_timeout before they are killed."""
+
+    reexec_command = None
+    """The command run to start a new server process on SIGUSR2 when handoff
+    is enabled, as a list of arguments, or None to rerun the command which
+    started this one (see rerun_command)."""
+
+    def __init__(self, address, application, numthreads=10, timeout=10,
+                 processes=1, reuse_port=False, maxthreads=-1, target_wait=.1,
+                 max_queue_size=0, max_queue_wait=0, statistics=False,
+                 engine='threaded', spool_threshold=0, handoff=False,
+                 header_timeout=0, body_timeout=0, minimum_rate=0,
+                 accept_batch=0, defer_accept=0):
+        if engine not in ('threaded', 'event'):
+            raise ValueError('unknown server engine %r' % engine)
         if isinstance(address, basestring):
             hostname, port = address.split(':')
         else:
@@ -2340,10 +3694,266 @@ class WsgiServer(CherryPyWSGIServer):
 
         address = (hostname, int(port))
         super(WsgiServer, self).__init__(address, application, numthreads=numthreads,
-            timeout=timeout)
+            max=maxthreads, timeout=timeout)
+
+        self.requests.target_wait = target_wait
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait = max_queue_wait
+        self.processes = processes
+        self.reuse_port = reuse_port
+        self.multiprocess = processes > 1
+        self.stats['Enabled'] = statistics
+        self.engine = engine
+        self.spool_threshold = spool_threshold
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.minimum_rate = minimum_rate
+        self.accept_batch = accept_batch
+        self.defer_accept = defer_accept
+        self.handoff = handoff
+        self.successor = None
+        self.supervising = False
+        self.workers = {}
+        self._ready_pipe = None
 
     def serve(self):
+        """Serve until interrupted, in this process or (if processes is more
+        than 1) in supervised worker processes.
+
+        If handoff is enabled, SIGUSR2 starts a new server process by running
+        reexec_command, handing it the listening socket. Once the new process
+        is ready to serve (with all of its worker processes, if it has more
+        than one), it sends SIGUSR1 to this one, which then stops accepting
+        connections, finishes the requests it is serving and exits.
+        """
+        if self.handoff:
+            signal.signal(signal.SIGUSR2, self._hand_off)
+            signal.signal(signal.SIGUSR1, self._yield_to_successor)
+
+        if self.processes > 1:
+            return self.supervise()
+
+        if self.socket is None:
+            self.prepare()
         try:
             self.start()
         except (KeyboardInterrupt, SystemExit):
             self.stop()
+
+    def prepare(self):
+        """Listen on the socket handed over by a previous server process, if
+        there is one, or create, bind and listen on a new one."""
+        fd = os.environ.pop(LISTEN_FD_VARIABLE, None)
+        if fd is None:
+            return super(WsgiServer, self).prepare()
+
+        if self.software is None:
+            self.software = "%s Server" % self.version
+
+        family = socket.AF_INET
+        if ':' in self.bind_addr[0]:
+            family = socket.AF_INET6
+
+        fd = int(fd)
+        self.socket = socket.fromfd(fd, family, socket.SOCK_STREAM)
+        os.close(fd)
+        prevent_socket_inheritance(self.socket)
+        self.socket.settimeout(1)
+
+    def supervise(self):
+        """Fork worker processes and supervise them until SIGTERM or SIGINT.
+
+        Unless reuse_port is set, the listening socket is bound here and
+        shared by every worker; otherwise each worker binds its own socket
+        with SO_REUSEPORT. Workers which exit are restarted. On SIGTERM or
+        SIGINT, the signal is forwarded to every worker as SIGTERM, which
+        stops it gracefully.
+        """
+        if self.socket is None and not self.reuse_port:
+            self.prepare()
+
+        self.supervising = True
+        handlers = {}
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            handlers[signum] = signal.signal(signum, self._terminate_workers)
+
+        try:
+            # A previous server process waiting to yield to this one is only
+            # notified once every worker is ready to accept connections.
+            if READY_PID_VARIABLE in os.environ:
+                self._ready_pipe = os.pipe()
+            for i in range(self.processes):
+                self._spawn_worker()
+            if self._ready_pipe is not None:
+                if self._await_workers():
+                    self._notify_ready()
+                elif self.supervising:
+                    os.environ.pop(READY_PID_VARIABLE, None)
+                    self.error_log("Worker processes exited before becoming ready; "
+                        "the previous server process was not notified", level=logging.ERROR)
+
+            deadline = None
+            while self.workers:
+                if self.supervising:
+                    pid, status = self._reap_worker(0)
+                else:
+                    if deadline is None:
+                        deadline = time.time() + self.shutdown_timeout + self.kill_timeout
+                    pid, status = self._reap_worker(os.WNOHANG)
+                    if not pid:
+                        if time.time() >= deadline:
+                            self._signal_workers(signal.SIGKILL)
+                        time.sleep(.1)
+                        continue
+
+                started = self.workers.pop(pid, None)
+                if started is None or not self.supervising:
+                    continue
+
+                self.error_log("Worker process %d %s; restarting"
+                    % (pid, describe_exit_status(status)), level=logging.WARNING)
+                delay = started + self.respawn_delay - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                if self.supervising:
+                    self._spawn_worker()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            if self.socket is not None:
+                self.socket.close()
+                self.socket = None
+
+    def _await_workers(self):
+        """Wait until every initial worker has reported that it is ready,
+        returning False if any exited first."""
+        reader, writer = self._ready_pipe
+        self._ready_pipe = None
+        os.close(writer)
+
+        remaining = self.processes
+        try:
+            while remaining > 0 and self.supervising:
+                try:
+                    data = os.read(reader, remaining)
+                except OSError, exception:
+                    if exception.errno == errno.EINTR:
+                        continue
+                    raise
+                if not data:
+                    break
+                remaining -= len(data)
+        finally:
+            os.close(reader)
+        return remaining == 0
+
+    def _reap_worker(self, options):
+        # Only worker processes are waited for, since a successor started by
+        # _hand_off() is also a child of this process.
+        while self.workers:
+            for pid in self.workers.keys():
+                try:
+                    reaped, status = os.waitpid(pid, os.WNOHANG)
+                except OSError, exception:
+                    if exception.errno == errno.EINTR:
+                        return 0, 0
+                    elif exception.errno == errno.ECHILD:
+                        return pid, 0
+                    raise
+                if reaped:
+                    return reaped, status
+            if options & os.WNOHANG or not self.supervising:
+                break
+            time.sleep(.1)
+        return 0, 0
+
+    def _signal_workers(self, signum):
+        for pid in self.workers.keys():
+            try:
+                os.kill(pid, signum)
+            except OSError:
+                pass
+
+    def _spawn_worker(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.time()
+            return pid
+
+        self.supervising = False
+        self.workers = {}
+        os.environ.pop(READY_PID_VARIABLE, None)
+        if self._ready_pipe is not None:
+            os.close(self._ready_pipe[0])
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, _raise_system_exit)
+        if self.handoff:
+            signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+            signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+
+        status = 0
+        try:
+            try:
+                self.start()
+            except (KeyboardInterrupt, SystemExit):
+                self.stop()
+        except Exception:
+            self.error_log("Worker process %d failed" % os.getpid(),
+                level=logging.ERROR, traceback=True)
+            status = 1
+        os._exit(status)
+
+    def _terminate_workers(self, signum, frame):
+        self.supervising = False
+        self._signal_workers(signal.SIGTERM)
+
+    def _hand_off(self, signum, frame):
+        if self.successor is not None and self.successor.poll() is None:
+            return
+
+        env = dict(os.environ)
+        env[READY_PID_VARIABLE] = str(os.getpid())
+
+        # Without SO_REUSEPORT, the new process takes over the listening
+        # socket, which must survive the exec to do so.
+        fd = None
+        if self.socket is not None:
+            fd = self.socket.fileno()
+            env[LISTEN_FD_VARIABLE] = str(fd)
+            flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+            fcntl.fcntl(fd, fcntl.F_SETFD, flags & ~fcntl.FD_CLOEXEC)
+
+        try:
+            self.successor = subprocess.Popen(self.reexec_command
+                or rerun_command(), env=env)
+        except OSError:
+            self.error_log("Failed to start a new server process",
+                level=logging.ERROR, traceback=True)
+        finally:
+            if fd is not None:
+                prevent_socket_inheritance(fd)
+
+    def _notify_ready(self):
+        if self._ready_pipe is not None:
+            # A worker process reports to its supervisor instead.
+            writer, self._ready_pipe = self._ready_pipe[1], None
+            try:
+                os.write(writer, '.')
+            finally:
+                os.close(writer)
+            return
+
+        pid = os.environ.pop(READY_PID_VARIABLE, None)
+        if pid:
+            try:
+                os.kill(int(pid), signal.SIGUSR1)
+            except (OSError, ValueError):
+                pass
+
+    def _yield_to_successor(self, signum, frame):
+        if self.successor is None:
+            return
+        if self.supervising:
+            self._terminate_workers(signum, frame)
+        elif not self.workers:
+            raise SystemExit()
@@ -0,0 +1,280 @@
+import mimetypes
+import os
+import stat
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+
+from scheme import Boolean, Integer, Text
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.http import (http_date, is_resource_modified, parse_accept_header,
+    parse_if_range_header, parse_range_header, quote_etag)
+from werkzeug.wsgi import wrap_file
+
+from spire.core import Configuration, configured_property
+from spire.wsgi.util import Mount
+
+ENTRY_OVERHEAD = 512
+
+class StaticFile(object):
+    """A file served by a StaticFiles mount, with its response headers and
+    validators computed once and, if it is small enough, its content."""
+
+    def __init__(self, filename, status, content_type, encoding=None, data=None):
+        self.filename = filename
+        self.size = status.st_size
+        self.mtime = status.st_mtime
+        self.checked = time.time()
+        self.data = data
+
+        self.etag = '%x-%x-%x' % (int(self.mtime), self.size,
+            zlib.adler32(filename) & 0xffffffff)
+        self.last_modified = datetime.utcfromtimestamp(int(self.mtime))
+
+        self.headers = [
+            ('Content-Type', content_type),
+            ('ETag', quote_etag(self.etag)),
+            ('Last-Modified', http_date(self.last_modified)),
+            ('Accept-Ranges', 'bytes'),
+        ]
+        if encoding:
+            self.headers.append(('Content-Encoding', encoding))
+
+    @property
+    def cost(self):
+        return len(self.data or '') + ENTRY_OVERHEAD
+
+class StaticFileCache(object):
+    """A least recently used cache of StaticFile entries, bounded by the total
+    size of the file content it holds."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.cost
+
+            self.entries[key] = entry
+            self.size += entry.cost
+            while self.size > self.capacity and self.entries:
+                key, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.cost
+
+    def discard(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.cost
+
+class FileRange(object):
+    """An iterable over a byte range of an open file, closing it when done."""
+
+    def __init__(self, openfile, start, length, blocksize=65536):
+        self.openfile = openfile
+        self.start = start
+        self.length = length
+        self.blocksize = blocksize
+
+    def __iter__(self):
+        self.openfile.seek(self.start)
+        remaining = self.length
+        while remaining > 0:
+            data = self.openfile.read(min(self.blocksize, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.openfile.close()
+
+class StaticFiles(Mount):
+    """A mount which serves the files beneath a root directory.
+
+    Files up to max_file_size bytes are kept in memory, in a cache bounded by
+    cache_size bytes; larger files are streamed from disk, through the
+    server's wsgi.file_wrapper when the whole file is requested. Files are
+    checked for changes at most once every check_interval seconds. Responses
+    carry an ETag and Last-Modified, conditional requests are answered with
+    304 and single byte ranges are served. If precompressed is enabled, a
+    foo.css.gz sibling of foo.css is served instead to clients which accept
+    gzip.
+    """
+
+    configuration = Configuration({
+        'cache_size': Integer(minimum=0, default=32 * 1024 * 1024),
+        'check_interval': Integer(minimum=0, default=2),
+        'max_age': Integer(minimum=0),
+        'max_file_size': Integer(minimum=0, default=1024 * 1024),
+        'precompressed': Boolean(default=False),
+        'root': Text(nonempty=True, required=True),
+    })
+
+    precompressed = configured_property('precompressed')
+
+    def __init__(self, root, cache_size, check_interval, max_file_size, max_age=None):
+        super(StaticFiles, self).__init__()
+        self.cache = StaticFileCache(cache_size)
+        self.check_interval = check_interval
+        self.max_file_size = max_file_size
+        self.root = os.path.abspath(root)
+
+        self.headers = []
+        if max_age is not None:
+            self.headers.append(('Cache-Control', 'public, max-age=%d' % max_age))
+        if self.precompressed:
+            self.headers.append(('Vary', 'Accept-Encoding'))
+
+    def dispatch(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method not in ('GET', 'HEAD'):
+            return MethodNotAllowed(['GET', 'HEAD'])(environ, start_response)
+
+        path = self._resolve_path(environ.get('PATH_INFO', ''))
+        if not path:
+            return NotFound()(environ, start_response)
+
+        entry = None
+        if self.precompressed and self._accepts_gzip(environ):
+            entry = self._get_entry(path, 'gzip')
+        if entry is None:
+            entry = self._get_entry(path)
+            if entry is None:
+                return NotFound()(environ, start_response)
+
+        headers = entry.headers + self.headers
+        if not is_resource_modified(environ, entry.etag,
+                last_modified=entry.last_modified):
+            start_response('304 Not Modified', headers)
+            return []
+
+        status, start, stop = '200 OK', 0, entry.size
+        if 'HTTP_RANGE' in environ and self._matches_if_range(environ, entry):
+            byte_range = parse_range_header(environ['HTTP_RANGE'])
+            if byte_range and byte_range.units == 'bytes' and len(byte_range.ranges) == 1:
+                start, stop = byte_range.ranges[0]
+                if start < 0:
+                    start, stop = max(entry.size + start, 0), entry.size
+                elif stop is None or stop > entry.size:
+                    stop = entry.size
+
+                if start >= stop:
+                    start_response('416 Requested Range Not Satisfiable', [
+                        ('Content-Range', 'bytes */%d' % entry.size),
+                        ('Content-Length', '0')])
+                    return []
+
+                status = '206 Partial Content'
+                headers = headers + [('Content-Range',
+                    'bytes %d-%d/%d' % (start, stop - 1, entry.size))]
+
+        start_response(status, headers + [('Content-Length', str(stop - start))])
+        if method == 'HEAD':
+            return []
+
+        if entry.data is not None:
+            if stop - start == entry.size:
+                return [entry.data]
+            return [entry.data[start:stop]]
+
+        openfile = open(entry.filename, 'rb')
+        if stop - start == entry.size:
+            return wrap_file(environ, openfile)
+        return FileRange(openfile, start, stop - start)
+
+    def _accepts_gzip(self, environ):
+        header = environ.get('HTTP_ACCEPT_ENCODING')
+        if header:
+            return parse_accept_header(header)['gzip'] > 0
+        return False
+
+    def _get_entry(self, path, encoding=None):
+        key = (path, encoding)
+        entry = self.cache.get(key)
+
+        now = time.time()
+        if entry is not None and now - entry.checked < self.check_interval:
+            return entry
+
+        filename = os.path.join(self.root, *path.split('/'))
+        if encoding:
+            filename += '.gz'
+
+        try:
+            status = os.stat(filename)
+        except OSError:
+            status = None
+        if status is None or not stat.S_ISREG(status.st_mode):
+            if entry is not None:
+                self.cache.discard(key)
+            return None
+
+        if entry is not None and (entry.size, entry.mtime) == (status.st_size,
+                status.st_mtime):
+            entry.checked = now
+            return entry
+
+        entry = self._load_entry(filename, path, encoding)
+        if entry is not None:
+            self.cache.put(key, entry)
+        return entry
+
+    def _load_entry(self, filename, path, encoding):
+        content_type = mimetypes.guess_type(path)[0] or 'text/plain'
+        try:
+            openfile = open(filename, 'rb')
+        except IOError:
+            return None
+
+        try:
+            status = os.fstat(openfile.fileno())
+            data = None
+            if status.st_size <= self.max_file_size:
+                data = openfile.read()
+        finally:
+            openfile.close()
+
+        entry = StaticFile(filename, status, content_type, encoding, data)
+        if data is not None:
+            entry.size = len(data)
+        return entry
+
+    def _matches_if_range(self, environ, entry):
+        header = environ.get('HTTP_IF_RANGE')
+        if not header:
+            return True
+
+        if_range = parse_if_range_header(header)
+        if if_range.etag:
+            return if_range.etag == entry.etag
+        if if_range.date:
+            return if_range.date == entry.last_modified
+        return False
+
+    def _resolve_path(self, pathinfo):
+        if '\x00' in pathinfo:
+            return None
+
+        segments = []
+        for segment in pathinfo.split('/'):
+            if segment in ('', '.'):
+                continue
+            if segment == '..' or os.sep in segment or (os.altsep and os.altsep in segment):
+                return None
+            segments.append(segment)
+        return '/'.join(segments)
@@ -1,11 +1,21 @@
+import errno
+import os
+
 import jinja2
-from jinja2 import ChoiceLoader, PackageLoader
+from jinja2 import ChoiceLoader, FileSystemBytecodeCache, PackageLoader
 from jinja2.filters import urlize
 
 STANDARD_EXTENSIONS = ['jinja2.ext.loopcontrols', 'jinja2.ext.with_']
 
 class TemplateEnvironment(jinja2.Environment):
-    def __init__(self, paths, extensions=None):
+    """A jinja2 environment loading templates from packages.
+
+    If cache_dir is given, compiled templates are kept in a bytecode cache
+    in that directory, so that they are compiled once rather than by every
+    process which renders them.
+    """
+
+    def __init__(self, paths, extensions=None, cache_dir=None):
         loaders = []
         for path in paths:
             loaders.append(PackageLoader(*path))
@@ -18,7 +28,39 @@ class TemplateEnvironment(jinja2.Environment):
         extensions = set(extensions or [])
         extensions.update(STANDARD_EXTENSIONS)
 
-        super(TemplateEnvironment, self).__init__(loader=loader, extensions=extensions)
+        bytecode_cache = None
+        if cache_dir:
+            try:
+                os.makedirs(cache_dir)
+            except OSError, exception:
+                if exception.errno != errno.EEXIST:
+                    raise
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+        super(TemplateEnvironment, self).__init__(loader=loader, extensions=extensions,
+            bytecode_cache=bytecode_cache)
+
+    def precompile(self):
+        """Load and compile every template the loaders can list, so that the
+        first render of each does not have to, and return a list of (name,
+        error) pairs for those which failed to load or compile, such as
+        files which are not templates at all."""
+        failures = []
+        for name in self.list_templates():
+            try:
+                self.get_template(name)
+            except Exception, exception:
+                failures.append((name, exception))
+        return failures
 
     def render_template(self, template, context=None):
         return self.get_template(template).render(context or {})
+
+    def stream_template(self, template, context=None, buffering=5):
+        """Return an iterator over the output of the template as it renders,
+        gathering it into pieces of this many chunks if buffering is more
+        than 1."""
+        stream = self.get_template(template).stream(context or {})
+        if buffering > 1:
+            stream.enable_buffering(buffering)
+        return stream
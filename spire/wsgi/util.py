@@ -1,13 +1,13 @@
 from scheme import Boolean, Sequence, Text
 from werkzeug.exceptions import InternalServerError, NotFound
 
-from spire.core import Configuration, Unit
+from spire.core import Configuration, Unit, Warmable
 from spire.local import ContextLocals
 from spire.support.logs import LogHelper
 
 log = LogHelper('spire.wsgi')
 
-class Mount(Unit):
+class Mount(Unit, Warmable):
     configuration = Configuration({
         'middleware': Sequence(Text(nonempty=True), unique=True),
         'path': Text(description='url path', nonempty=True),
@@ -62,31 +62,26 @@ class Middleware(object):
         return MiddlewareWrapper(self, application)
 
 class MountDispatcher(object):
+    """Dispatches each request to the mount with the longest path which is
+    a prefix of the request path, ending at a segment boundary.
+
+    Mount paths are kept in a trie of path segments, in which each node is
+    a dict mapping segments to child nodes and None to the mount (if any)
+    whose path ends there, so that a request path is resolved in a single
+    pass over its segments.
+    """
+
     def __init__(self, mounts=None):
         self.mounts = {}
+        self.trie = {}
         if mounts:
             for mount in mounts:
                 self.mount(mount)
 
     def dispatch(self, environ, start_response):
-        script = environ.get('PATH_INFO', '')
-        pathinfo = ''
-
-        mounts = self.mounts
-        while '/' in script:
-            try:
-                mount = mounts[script]
-            except KeyError:
-                segments = script.split('/')
-                script = '/'.join(segments[:-1])
-                pathinfo = '/%s%s' % (segments[-1], pathinfo)
-            else:
-                break
-        else:
-            try:
-                mount = mounts['/']
-            except KeyError:
-                return NotFound()(environ, start_response)
+        mount, script, pathinfo = self.resolve(environ.get('PATH_INFO', ''))
+        if mount is None:
+            return NotFound()(environ, start_response)
 
         environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + mount.unshared_path
         environ['PATH_INFO'] = mount.shared_path + pathinfo
@@ -98,5 +93,39 @@ class MountDispatcher(object):
         path = mount.path
         if path not in self.mounts:
             self.mounts[path] = mount
+            node = self.trie
+            for segment in path.split('/'):
+                node = node.setdefault(segment, {})
+            node[None] = mount
         else:
             log('warning', 'mount %r declares duplicate path %r', mount, path)
+
+    def resolve(self, path):
+        """Return the mount for the given request path, the part of the path
+        it was matched on and the remainder, or (None, '', path) if no mount
+        matches. Paths which match no other mount fall back to the mount at
+        '/', with the path from its first slash as the remainder."""
+        node, mount, end = self.trie, None, -1
+        start, length = 0, len(path)
+        while True:
+            stop = path.find('/', start)
+            if stop < 0:
+                stop = length
+
+            node = node.get(path[start:stop])
+            if node is None:
+                break
+            if None in node:
+                mount, end = node[None], stop
+            if stop == length:
+                break
+            start = stop + 1
+
+        if mount is None:
+            mount = self.mounts.get('/')
+            if mount is None:
+                return None, '', path
+            end = path.find('/')
+            if end < 0:
+                end = length
+        return mount, path[:end], path[end:]
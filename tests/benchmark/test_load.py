@@ -0,0 +1,57 @@
+import threading
+import time
+
+from unittest2 import TestCase
+
+from spire.benchmark.load import count_retained_objects, generate_load, \
+    generate_load_in_subprocess
+from spire.wsgi.server import WsgiServer
+
+def application(environ, start_response):
+    path = environ['PATH_INFO']
+    status = '404 Not Found' if path == '/missing' else '200 OK'
+    start_response(status, [('Content-Type', 'text/plain')])
+    if path == '/chunked':
+        return iter(['hello ', 'world'])
+    return ['hello world']
+
+class TestLoadGeneration(TestCase):
+    def setUp(self):
+        self.errors = []
+        self.server = WsgiServer(('127.0.0.1', 0), application, numthreads=4)
+        self.server.error_log = lambda msg='', *args, **params: self.errors.append(msg)
+        self.server.prepare()
+        self.address = self.server.socket.getsockname()[:2]
+
+        self.thread = threading.Thread(target=self.server.start)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        while not self.server.ready:
+            time.sleep(.01)
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(5)
+        self.assertEqual(self.errors, [])
+
+    def test_load(self):
+        for path in ('/', '/chunked'):
+            result = generate_load(self.address, path, concurrency=2, duration=.5)
+            self.assertGreater(result.requests, 0)
+            self.assertEqual(result.errors, 0)
+            self.assertLessEqual(result.percentile(50), result.percentile(99))
+            self.assertEqual(result.percentile(100), max(result.latencies))
+
+    def test_load_in_subprocess(self):
+        result = generate_load_in_subprocess(self.address, '/', concurrency=2,
+            duration=.5)
+        self.assertGreater(result.requests, 0)
+        self.assertEqual(result.errors, 0)
+
+    def test_errors(self):
+        result = generate_load(self.address, '/missing', concurrency=1, duration=.2)
+        self.assertEqual(result.requests, 0)
+        self.assertGreater(result.errors, 0)
+
+    def test_count_retained_objects(self):
+        self.assertLess(count_retained_objects(application, '/', iterations=200), 1)
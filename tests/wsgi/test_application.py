@@ -0,0 +1,177 @@
+import sys
+
+from unittest2 import TestCase
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import BaseConverter, Map, RequestRedirect, Rule
+from werkzeug.test import Client, create_environ
+from werkzeug.wrappers import BaseResponse
+
+from spire.wsgi.application import Application, Mediator, Request, Response, \
+    RouteCache, construct_invoker, view
+
+@view('item')
+def item(request, id):
+    if id == 0:
+        raise ValueError(id)
+    return 'item %d' % id
+
+class RecordingMediator(Mediator):
+    def __init__(self):
+        self.calls = []
+
+    def mediate_exception(self, request, exception):
+        self.calls.append(('exception', request.endpoint))
+        return Response('failed', status=500)
+
+    def mediate_request(self, request):
+        self.calls.append(('request', request.endpoint))
+
+class TestApplication(TestCase):
+    def construct_application(self):
+        class TestApplication(Application):
+            passive = Mediator()
+            recording = RecordingMediator()
+
+        return TestApplication(path='/test', urls=[Rule('/item/<int:id>', endpoint='item')],
+            views=[sys.modules[__name__]], mediators=['passive', 'recording'])
+
+    def test_dispatch(self):
+        application = self.construct_application()
+        client = Client(application, BaseResponse)
+
+        response = client.get('/item/1')
+        self.assertEqual((response.status_code, response.data), (200, 'item 1'))
+        response = client.get('/item/0')
+        self.assertEqual((response.status_code, response.data), (500, 'failed'))
+        self.assertEqual(client.get('/other').status_code, 404)
+
+        self.assertEqual(application.recording.calls, [('request', None),
+            ('request', None), ('exception', 'item'), ('request', None)])
+
+    def test_mediator_phases(self):
+        application = self.construct_application()
+        recording = application.recording
+        self.assertEqual(application.request_mediators, [recording.mediate_request])
+        self.assertEqual(application.exception_mediators, [recording.mediate_exception])
+        self.assertEqual(application.response_mediators, [])
+
+    def test_warmup(self):
+        application = Application(path='/test', urls=[], templates=[('tests.wsgi', 'templates')],
+            template_warmup=True)
+        application.warmup()
+        self.assertEqual(len(application.environment.cache), 2)
+
+    def test_render_stream(self):
+        application = Application(path='/test', urls=[], templates=[('tests.wsgi', 'templates')])
+        request = Request(application, create_environ('/'), None)
+        response = request.render_stream('items.html', items=['a', 'b'])
+
+        self.assertNotIsInstance(response.response, list)
+        self.assertEqual(response.content_length, None)
+        self.assertEqual(list(response.iter_encoded()), ['<li>a</li>\n<li>b</li>\n'])
+
+    def test_render_stream_unbinds_on_error(self):
+        def items():
+            yield 'a'
+            self.assertIs(Request.current_request(), request)
+            raise ValueError('failed mid-stream')
+
+        application = Application(path='/test', urls=[], templates=[('tests.wsgi', 'templates')])
+        request = Request(application, create_environ('/'), None)
+        response = request.render_stream('items.html', items=items())
+
+        self.assertRaises(ValueError, list, response.iter_encoded())
+        self.assertIs(Request.current_request(), None)
+
+class TestInvoker(TestCase):
+    def test_function(self):
+        invoke = construct_invoker(lambda request, id: (request, id))
+        self.assertEqual(invoke('request', {'id': 1, 'endpoint': 'item'}), ('request', 1))
+
+    def test_callable_instance(self):
+        class View(object):
+            def __call__(self, request, endpoint=None):
+                return endpoint
+
+        invoke = construct_invoker(View())
+        self.assertEqual(invoke('request', {'id': 1, 'endpoint': 'item'}), 'item')
+        self.assertEqual(invoke('request', {}), None)
+
+class TestRequest(TestCase):
+    def test_environ_attributes(self):
+        environ = create_environ('/')
+        environ['request.session'] = session = {}
+        request = Request(None, environ, None)
+
+        self.assertIs(request.session, session)
+        self.assertRaises(AttributeError, getattr, request, 'context')
+        environ['request.context'] = 'context'
+        self.assertEqual(request.context, 'context')
+
+    def test_template_context(self):
+        request = Request(None, create_environ('/'), None)
+        request.template_context['a'] = 1
+        self.assertEqual(request.template_context, {'a': 1})
+
+        request.template_context = {'b': 2}
+        self.assertEqual(request.template_context, {'b': 2})
+
+class TestRouteCache(TestCase):
+    def setUp(self):
+        self.urls = Map([
+            Rule('/', endpoint='index'),
+            Rule('/items/', endpoint='items'),
+            Rule('/items/<int:id>', endpoint='item'),
+            Rule('/form', endpoint='form', methods=['POST']),
+        ])
+        self.routes = RouteCache(self.urls, 2)
+
+    def match(self, path, method='GET'):
+        adapter = self.urls.bind_to_environ(create_environ(path, method=method))
+        return self.routes.match(adapter)
+
+    def test_matches(self):
+        for i in range(2):
+            self.assertEqual(self.match('/'), ('index', {}))
+            self.assertEqual(self.match('/items/1'), ('item', {'id': 1}))
+            self.assertEqual(self.match('/form', 'POST'), ('form', {}))
+        self.assertEqual(len(self.routes.static), 2)
+        self.assertEqual(len(self.routes.entries), 1)
+
+    def test_params_are_copied(self):
+        self.match('/items/1')[1]['endpoint'] = 'item'
+        self.assertEqual(self.match('/items/1'), ('item', {'id': 1}))
+
+    def test_eviction(self):
+        for id in range(5):
+            self.assertEqual(self.match('/items/%d' % id), ('item', {'id': id}))
+        self.assertEqual(self.routes.entries.keys()[-1][2], '/items/4')
+        self.assertEqual(len(self.routes.entries), 2)
+
+    def test_failures_are_not_cached(self):
+        for i in range(2):
+            self.assertRaises(RequestRedirect, self.match, '/items')
+            self.assertRaises(NotFound, self.match, '/missing')
+            self.assertRaises(MethodNotAllowed, self.match, '/form')
+        self.assertFalse(self.routes.static or self.routes.entries)
+
+    def test_invalidation(self):
+        self.assertRaises(NotFound, self.match, '/new')
+        self.match('/')
+        self.urls.add(Rule('/new', endpoint='new'))
+        self.routes.invalidate()
+        self.assertEqual(self.match('/new'), ('new', {}))
+        self.assertEqual(self.routes.static.keys(), [('GET', '', '/new')])
+
+    def test_mutable_params_are_copied(self):
+        class ListConverter(BaseConverter):
+            def to_python(self, value):
+                return value.split(',')
+
+        urls = Map([Rule('/tags/<list:tags>', endpoint='tags')],
+            converters={'list': ListConverter})
+        routes = RouteCache(urls)
+        adapter = urls.bind_to_environ(create_environ('/tags/a,b'))
+
+        routes.match(adapter)[1]['tags'].append('c')
+        self.assertEqual(routes.match(adapter), ('tags', {'tags': ['a', 'b']}))
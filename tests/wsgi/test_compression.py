@@ -0,0 +1,89 @@
+import zlib
+
+from unittest2 import TestCase
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from spire.wsgi.compression import CompressionMiddleware
+
+BODY = 'a compressible line of text\n' * 100
+
+def construct_application(headers=None, chunks=None, status='200 OK'):
+    def application(environ, start_response):
+        start_response(status, headers or [('Content-Type', 'text/plain')])
+        return chunks if chunks is not None else [BODY]
+    return application
+
+class TestCompressionMiddleware(TestCase):
+    def request(self, application, encoding='gzip', **params):
+        middleware = CompressionMiddleware(**params)
+        client = Client(middleware.wrap(application), BaseResponse)
+
+        headers = []
+        if encoding:
+            headers.append(('Accept-Encoding', encoding))
+        return client.get('/', headers=headers)
+
+    def decompress(self, response):
+        encoding = response.headers.get('Content-Encoding')
+        if encoding == 'gzip':
+            return zlib.decompress(response.data, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            return zlib.decompress(response.data)
+        return response.data
+
+    def test_gzip(self):
+        response = self.request(construct_application(chunks=iter(BODY.splitlines(True))))
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertLess(len(response.data), len(BODY))
+        self.assertEqual(self.decompress(response), BODY)
+
+    def test_deflate(self):
+        response = self.request(construct_application(), 'deflate, gzip;q=0.5')
+        self.assertEqual(response.headers['Content-Encoding'], 'deflate')
+        self.assertEqual(self.decompress(response), BODY)
+
+    def test_declared_length(self):
+        headers = [('Content-Type', 'application/json'), ('Content-Length', str(len(BODY))),
+            ('Vary', 'Cookie'), ('ETag', '"abc"')]
+        response = self.request(construct_application(headers))
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Cookie, Accept-Encoding')
+        self.assertEqual(response.headers['ETag'], 'W/"abc"')
+        self.assertNotEqual(response.headers.get('Content-Length'), str(len(BODY)))
+        self.assertEqual(self.decompress(response), BODY)
+
+    def test_uncompressed_responses(self):
+        response = self.request(construct_application(), None)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        response = self.request(construct_application(), 'gzip;q=0, identity')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        response = self.request(construct_application(chunks=['small']))
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, 'small')
+
+        response = self.request(construct_application([('Content-Type', 'image/png')]))
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, BODY)
+
+        response = self.request(construct_application([('Content-Type', 'text/plain'),
+            ('Content-Encoding', 'br')]))
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(response.data, BODY)
+
+        response = self.request(construct_application(status='304 Not Modified', chunks=[]))
+        self.assertNotIn('Content-Encoding', response.headers)
+
+        response = self.request(construct_application(), enabled=False)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_minimum_size(self):
+        response = self.request(construct_application(chunks=['x' * 50]), minimum_size=10)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(self.decompress(response), 'x' * 50)
+
+        response = self.request(construct_application(), minimum_size=len(BODY) + 1)
+        self.assertNotIn('Content-Encoding', response.headers)
@@ -0,0 +1,33 @@
+from unittest2 import TestCase
+
+from spire.wsgi.metrics import render_statistics
+from spire.wsgi.server import Histogram
+
+class TestRenderStatistics(TestCase):
+    def test_rendering(self):
+        histogram = Histogram()
+        histogram.record(.5)
+
+        statistics = {'Test Server': {
+            'Enabled': True,
+            'Bind Address': '127.0.0.1:8080',
+            'Accepts': 4,
+            'Accepts/sec': lambda s: s['Accepts'] / 2.0,
+            'Timings': {'Parse': histogram},
+            'Worker Threads': {'Thread-1': {'Requests': lambda s: 3}},
+        }}
+
+        lines = render_statistics(statistics).splitlines()
+        self.assertIn('accepts{namespace="Test Server"} 4', lines)
+        self.assertIn('accepts_sec{namespace="Test Server"} 2.0', lines)
+        self.assertIn('enabled{namespace="Test Server"} 1', lines)
+        self.assertIn('timings{namespace="Test Server",name="Parse",quantile="0.5"} 0.5',
+            lines)
+        self.assertIn('timings_count{namespace="Test Server",name="Parse"} 1', lines)
+        self.assertIn('timings_sum{namespace="Test Server",name="Parse"} 0.5', lines)
+        self.assertIn('worker_threads_requests{namespace="Test Server",name="Thread-1"} 3',
+            lines)
+        self.assertFalse([line for line in lines if 'bind_address' in line])
+
+    def test_empty_statistics(self):
+        self.assertEqual(render_statistics({}), '')
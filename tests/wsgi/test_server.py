@@ -0,0 +1,841 @@
+import errno
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from StringIO import StringIO
+from httplib import HTTPConnection, IncompleteRead
+from tempfile import TemporaryFile
+
+from unittest2 import TestCase
+
+from spire.wsgi.server import EventLoop, HTTPConnection as ServerConnection, \
+    ChunkedRFile, HTTPRequest, HTTPServer, Histogram, MaxSizeExceeded, SpooledRFile, \
+    WsgiServer, describe_exit_status, rerun_command
+
+def hello_application(environ, start_response):
+    body = 'hello %s' % environ['PATH_INFO']
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+        ('Content-Length', str(len(body)))])
+    return [body]
+
+class ServerTestCase(TestCase):
+    application = staticmethod(hello_application)
+    accept_batch = 0
+    engine = 'threaded'
+    numthreads = 2
+    timeout = 10
+
+    def setUp(self):
+        self.server = self.construct_server()
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+        while not self.server.ready:
+            time.sleep(.01)
+        self.port = self.server.socket.getsockname()[1]
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join(5)
+
+    def construct_server(self):
+        return WsgiServer(('127.0.0.1', 0), self.application,
+            numthreads=self.numthreads, timeout=self.timeout, engine=self.engine,
+            accept_batch=self.accept_batch)
+
+    def connect(self):
+        return HTTPConnection('127.0.0.1', self.port, timeout=5)
+
+    def request(self, connection, path='/', method='GET', body=None, headers=None):
+        connection.request(method, path, body, headers or {})
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+
+class TestServer(ServerTestCase):
+    def test_simple_request(self):
+        status, headers, body = self.request(self.connect(), '/test')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, 'hello /test')
+
+    def test_keepalive_requests(self):
+        connection = self.connect()
+        for i in range(3):
+            status, headers, body = self.request(connection, '/%d' % i)
+            self.assertEqual(body, 'hello /%d' % i)
+        connection.close()
+
+    def test_idle_connections_do_not_exhaust_workers(self):
+        connections = [self.connect() for i in range(self.numthreads * 5)]
+        for connection in connections:
+            self.assertEqual(self.request(connection)[0], 200)
+
+        for i, connection in enumerate(connections):
+            status, headers, body = self.request(connection, '/%d' % i)
+            self.assertEqual(body, 'hello /%d' % i)
+
+        for connection in connections:
+            connection.close()
+
+HEADERS = ''.join('X-Header-%d: value %d\r\n' % (i, i) for i in range(20))
+
+HEADS = [
+    'GET /path?query HTTP/1.1\r\nHost: example.com\r\n' + HEADERS + '\r\n',
+    '\r\nGET / HTTP/1.1\r\nHost: example.com\r\n\r\n',
+    '\r\n\r\nGET / HTTP/1.1\r\n\r\n',
+    'GET / HTTP/1.1\r\nAccept: text/html\r\naccept: text/plain\r\n'
+        'x-folded: one\r\n two\r\n\r\n',
+    'POST / HTTP/1.1\r\nHost: example.com\r\nContent-Length: 4\r\n\r\nbody'
+        'GET /next HTTP/1.1\r\n\r\n',
+    'GET / HTTP/1.1\nHost: example.com\n\n',
+    'GET / HTTP/1.1\r\nHost: example.com\nAccept: */*\r\n\r\n',
+    'GET / HTTP/1.1\r\nno colon here\r\n\r\n',
+    'GET / HTTP/1.1\r\nHost: exa\rmple.com\r\n\r\n',
+    'GET / HTTP/1.1\r\nHost: exam',
+    'GET / HT',
+    'GARBAGE\r\n\r\n',
+    '',
+]
+
+def parse_head(head, head_buffer_size, max_request_header_size=0):
+    server = HTTPServer(('127.0.0.1', 0), None)
+    server.max_request_header_size = max_request_header_size
+    client, sock = socket.socketpair()
+    client.sendall(head)
+    client.shutdown(socket.SHUT_WR)
+
+    connection = ServerConnection(server, sock)
+    connection.head_buffer_size = head_buffer_size
+    request = HTTPRequest(server, connection)
+    try:
+        request.parse_request()
+    except Exception, exception:
+        error = type(exception)
+    else:
+        error = None
+
+    remaining = None
+    if request.ready:
+        remaining = connection.rfile.read()
+    sock.shutdown(socket.SHUT_WR)
+    response = client.makefile().read()
+    client.close()
+    sock.close()
+
+    return (error, request.ready, getattr(request, 'uri', None),
+        request.inheaders, response, remaining)
+
+class TestHeadParsing(TestCase):
+    def assertParsedAlike(self, head, **params):
+        expected = parse_head(head, 0, **params)
+        for size in (8192, 16):
+            self.assertEqual(parse_head(head, size, **params), expected)
+        return expected
+
+    def test_heads(self):
+        for head in HEADS:
+            self.assertParsedAlike(head)
+
+    def test_parsed_result(self):
+        error, ready, uri, headers, response, remaining = \
+            self.assertParsedAlike(HEADS[4])
+        self.assertTrue(ready)
+        self.assertEqual(headers['Content-Length'], '4')
+        self.assertEqual(remaining, 'bodyGET /next HTTP/1.1\r\n\r\n')
+
+        headers = self.assertParsedAlike(HEADS[3])[3]
+        self.assertEqual(headers['Accept'], 'text/html, text/plain')
+        self.assertEqual(headers['X-Folded'], 'two')
+
+    def test_maximum_sizes(self):
+        head = HEADS[0]
+        for size in (10, len(head.split('\r\n')[0]) + 2, 100, len(head) - 1,
+                len(head)):
+            self.assertParsedAlike(head, max_request_header_size=size)
+
+        response = self.assertParsedAlike(head, max_request_header_size=10)[4]
+        self.assertTrue(response.startswith('HTTP/1.1 414'))
+        response = self.assertParsedAlike(head, max_request_header_size=100)[4]
+        self.assertTrue(response.startswith('HTTP/1.1 413'))
+
+def environ_application(environ, start_response):
+    body = repr(sorted((key, value) for key, value in environ.iteritems()
+        if isinstance(value, (basestring, bool, tuple))))
+    environ['HTTP_X_LEAKED'] = 'leaked'
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+        ('Content-Length', str(len(body)))])
+    return [body]
+
+class TestServerEnviron(ServerTestCase):
+    application = staticmethod(environ_application)
+
+    def test_environ(self):
+        connection = self.connect()
+        for i in range(2):
+            status, headers, body = self.request(connection, '/path%d?a=b' % i,
+                'POST', 'body', {'Content-Type': 'text/plain', 'X-Custom': 'x'})
+            environ = dict(eval(body))
+
+            self.assertEqual(environ['PATH_INFO'], '/path%d' % i)
+            self.assertEqual(environ['QUERY_STRING'], 'a=b')
+            self.assertEqual(environ['REQUEST_METHOD'], 'POST')
+            self.assertEqual(environ['REQUEST_URI'], '/path%d?a=b' % i)
+            self.assertEqual(environ['SERVER_PROTOCOL'], 'HTTP/1.1')
+            self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+            self.assertEqual(environ['CONTENT_LENGTH'], '4')
+            self.assertEqual(environ['HTTP_X_CUSTOM'], 'x')
+            self.assertEqual(environ['REMOTE_ADDR'], '127.0.0.1')
+            self.assertEqual(environ['SERVER_PORT'], '0')
+            self.assertEqual(environ['wsgi.url_scheme'], 'http')
+            self.assertEqual(environ['wsgi.version'], (1, 0))
+            self.assertFalse(environ['wsgi.multiprocess'])
+            self.assertNotIn('HTTP_CONTENT_TYPE', environ)
+            self.assertNotIn('HTTP_X_LEAKED', environ)
+
+class TestHistogram(TestCase):
+    def test_percentiles(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+
+        for i in range(1, 101):
+            histogram.record(i / 1000.0)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.total, 5.05)
+
+        for percent in (50, 95, 99):
+            value = histogram.percentile(percent)
+            self.assertGreaterEqual(value, percent / 1000.0)
+            self.assertLess(value, percent / 1000.0 * 1.2)
+        self.assertEqual(histogram.percentile(100), .1)
+
+        histogram.record(1000)
+        self.assertEqual(histogram.percentile(100), 1000)
+
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 101)
+        self.assertEqual(summary['p50'], histogram.percentile(50))
+
+class TestServerTimings(ServerTestCase):
+    def construct_server(self):
+        return WsgiServer(('127.0.0.1', 0), self.application, numthreads=2,
+            statistics=True)
+
+    def test_timings(self):
+        connection = self.connect()
+        for i in range(3):
+            self.request(connection)
+
+        timings = self.server.stats['Timings']
+        self.assertEqual(timings['Parse'].count, 3)
+        self.assertEqual(timings['Application'].count, 3)
+        self.assertEqual(timings['Write'].count, 3)
+        self.assertGreaterEqual(timings['Queue'].count, 1)
+
+class TestServerCounters(ServerTestCase):
+    def test_counters_without_statistics(self):
+        connection = self.connect()
+        for i in range(3):
+            self.request(connection)
+        connection.close()
+        time.sleep(.1)
+
+        stats = self.server.stats
+        self.assertFalse(stats['Enabled'])
+        self.assertEqual(stats['Requests'](stats), 3)
+        self.assertEqual(stats['Accepts'], 1)
+        self.assertGreater(stats['Bytes Read'](stats), 0)
+        self.assertGreater(stats['Bytes Written'](stats), 0)
+        self.assertEqual(stats['Timings']['Parse'].count, 0)
+
+        workers = stats['Worker Threads'].values()
+        self.assertEqual(len(workers), self.numthreads)
+        self.assertEqual(sum(w['Requests'](w) for w in workers), 3)
+
+        self.server.clear_stats()
+        stats = self.server.stats
+        self.assertEqual(stats['Requests'](stats), 0)
+        self.assertEqual(len(stats['Worker Threads']), self.numthreads)
+
+BODY = ''.join(chr(i % 251) for i in range(3 * 1024 * 1024 + 11)) + '\nlast line\n'
+
+def upload_application(environ, start_response):
+    wsgi_input, mode = environ['wsgi.input'], environ['PATH_INFO']
+    if mode == '/read':
+        body = wsgi_input.read()
+    elif mode == '/chunks':
+        chunks = []
+        chunk = wsgi_input.read(10000)
+        while chunk:
+            chunks.append(chunk)
+            chunk = wsgi_input.read(10000)
+        body = ''.join(chunks)
+    elif mode == '/lines':
+        body = ''.join(wsgi_input.readline() for i in range(BODY.count('\n') + 1))
+    elif mode == '/readinto':
+        buffer, chunks = bytearray(70000), []
+        size = wsgi_input.readinto(buffer)
+        while size:
+            chunks.append(str(buffer[:size]))
+            size = wsgi_input.readinto(buffer)
+        body = ''.join(chunks)
+    elif mode == '/reread':
+        wsgi_input.read(1000)
+        wsgi_input.seek(0)
+        body = wsgi_input.read()
+    elif mode == '/dawdle':
+        chunks = []
+        chunk = wsgi_input.read(1)
+        while chunk:
+            chunks.append(chunk)
+            time.sleep(.25)
+            chunk = wsgi_input.read(1)
+        body = ''.join(chunks)
+    else:
+        body = ''
+
+    if mode != '/spooled':
+        body = str(body == BODY)
+    elif not isinstance(wsgi_input, SpooledRFile):
+        body = 'unspooled'
+    else:
+        body = 'disk' if wsgi_input._rolled else 'memory'
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+        ('Content-Length', str(len(body)))])
+    return [body]
+
+class TestChunkedRFile(TestCase):
+    def test_oversized_chunk(self):
+        rfile = ChunkedRFile(StringIO('10\r\n%s\r\n0\r\n\r\n' % ('x' * 16)), 8)
+        with self.assertRaises(IOError) as context:
+            rfile.read()
+        self.assertIsInstance(context.exception, MaxSizeExceeded)
+
+class TestServerRequestBodies(ServerTestCase):
+    application = staticmethod(upload_application)
+    modes = ('/read', '/chunks', '/lines', '/readinto')
+
+    def test_bodies_with_content_length(self):
+        connection = self.connect()
+        for mode in self.modes:
+            status, headers, body = self.request(connection, mode, 'POST', BODY)
+            self.assertEqual(body, 'True')
+
+    def test_chunked_bodies(self):
+        connection = self.connect()
+        for mode in self.modes:
+            connection.putrequest('POST', mode)
+            connection.putheader('Transfer-Encoding', 'chunked')
+            connection.endheaders()
+            for i in range(0, len(BODY), 100000):
+                chunk = BODY[i:i + 100000]
+                connection.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+            connection.send('0\r\n\r\n')
+            self.assertEqual(connection.getresponse().read(), 'True')
+
+    def test_unread_body_is_discarded(self):
+        connection = self.connect()
+        for i in range(2):
+            status, headers, body = self.request(connection, '/ignore', 'POST', BODY)
+            self.assertEqual(body, 'False')
+
+class TestServerSpooledRequestBodies(TestServerRequestBodies):
+    modes = TestServerRequestBodies.modes + ('/reread',)
+
+    def construct_server(self):
+        server = super(TestServerSpooledRequestBodies, self).construct_server()
+        server.spool_threshold = 1024 * 1024
+        return server
+
+    def test_small_bodies(self):
+        connection = self.connect()
+        for mode in self.modes:
+            status, headers, body = self.request(connection, mode, 'POST', 'small')
+            self.assertEqual(body, 'False')
+
+        status, headers, body = self.request(connection, '/spooled', 'POST', 'small')
+        self.assertEqual(body, 'memory')
+
+    def test_bodiless_requests_are_not_spooled(self):
+        status, headers, body = self.request(self.connect(), '/spooled')
+        self.assertEqual(body, 'unspooled')
+
+    def test_large_bodies_spool_to_disk(self):
+        connection = self.connect()
+        status, headers, body = self.request(connection, '/spooled', 'POST', BODY)
+        self.assertEqual(body, 'disk')
+
+    def test_large_chunked_bodies(self):
+        self.server.max_request_body_size = 1000
+        connection = self.connect()
+        connection.putrequest('POST', '/read')
+        connection.putheader('Transfer-Encoding', 'chunked')
+        connection.endheaders()
+        connection.send('%x\r\n%s\r\n0\r\n\r\n' % (2000, 'x' * 2000))
+        self.assertEqual(connection.getresponse().status, 413)
+
+class TestServerDeadlines(ServerTestCase):
+    application = staticmethod(upload_application)
+
+    def construct_server(self):
+        server = super(TestServerDeadlines, self).construct_server()
+        server.header_timeout = server.body_timeout = 1
+        server.minimum_rate = 20
+        return server
+
+    def send_slowly(self, connection, data, size, interval, duration):
+        started = time.time()
+        for i in range(0, len(data), size):
+            if time.time() - started > duration:
+                break
+            try:
+                connection.sendall(data[i:i + size])
+            except socket.error:
+                break
+            time.sleep(interval)
+
+    def test_slow_head(self):
+        connection = socket.create_connection(('127.0.0.1', self.port))
+        self.send_slowly(connection, 'GET /read HTTP/1.1\r\n' + 'X' * 100, 1, .3, 4)
+        self.assertTrue(connection.recv(4096).startswith('HTTP/1.1 408'))
+        connection.close()
+
+    def test_slow_body(self):
+        connection = socket.create_connection(('127.0.0.1', self.port))
+        connection.sendall('POST /read HTTP/1.1\r\nContent-Length: 1000\r\n\r\n')
+        self.send_slowly(connection, 'x' * 1000, 1, .3, 4)
+        self.assertTrue(connection.recv(4096).startswith('HTTP/1.1 408'))
+        connection.close()
+
+    def test_steady_requests(self):
+        connection = socket.create_connection(('127.0.0.1', self.port))
+        head = 'POST /read HTTP/1.1\r\nX-Padding: %s\r\nContent-Length: 60\r\n\r\n'
+        self.send_slowly(connection, head % ('x' * 40), 10, .2, 10)
+        self.send_slowly(connection, 'x' * 60, 10, .2, 10)
+        self.assertTrue(connection.recv(4096).startswith('HTTP/1.1 200'))
+        connection.close()
+
+    def test_slow_application(self):
+        connection = socket.create_connection(('127.0.0.1', self.port))
+        connection.sendall('POST /dawdle HTTP/1.1\r\nContent-Length: 10\r\n\r\n')
+        time.sleep(.1)
+        connection.sendall('x' * 10)
+        self.assertTrue(connection.recv(4096).startswith('HTTP/1.1 200'))
+        connection.close()
+
+class TestServerIdleTimeout(ServerTestCase):
+    timeout = 1
+
+    def test_idle_connection_is_closed(self):
+        connection = self.connect()
+        self.assertEqual(self.request(connection)[0], 200)
+
+        time.sleep(2.5)
+        self.assertEqual(connection.sock.recv(1), '')
+
+def slow_application(environ, start_response):
+    time.sleep(.5)
+    return hello_application(environ, start_response)
+
+class TestServerAutoscaling(ServerTestCase):
+    application = staticmethod(slow_application)
+    numthreads = 1
+
+    def construct_server(self):
+        server = WsgiServer(('127.0.0.1', 0), self.application, numthreads=1,
+            maxthreads=4, target_wait=.1)
+        server.requests.control_interval = .1
+        server.requests.idle_timeout = .5
+        return server
+
+    def test_pool_grows_and_shrinks(self):
+        threads = []
+        for i in range(8):
+            thread = threading.Thread(target=self.request, args=(self.connect(),))
+            thread.start()
+            threads.append(thread)
+
+        started = time.time()
+        for thread in threads:
+            thread.join()
+
+        self.assertLess(time.time() - started, 8 * .5)
+        self.assertGreater(len(self.server.requests._threads), 1)
+        self.assertLessEqual(len(self.server.requests._threads), 4)
+
+        time.sleep(2)
+        self.assertEqual(len(self.server.requests._threads), 1)
+        self.assertEqual(self.server.stats['Requests'](self.server.stats), 8)
+
+class TestServerLoadShedding(ServerTestCase):
+    application = staticmethod(slow_application)
+    numthreads = 1
+
+    def construct_server(self):
+        server = super(TestServerLoadShedding, self).construct_server()
+        server.max_queue_size = 1
+        server.stats['Enabled'] = True
+        return server
+
+    def test_overload_is_shed(self):
+        busy, queued = self.connect(), self.connect()
+        busy.request('GET', '/busy')
+        time.sleep(.1)
+        queued.request('GET', '/queued')
+        time.sleep(.1)
+
+        status, headers, body = self.request(self.connect(), '/shed')
+        self.assertEqual(status, 503)
+        self.assertEqual(headers['retry-after'], '1')
+        self.assertEqual(self.server.stats['Shed Connections'], 1)
+
+        self.assertEqual(busy.getresponse().read(), 'hello /busy')
+        self.assertEqual(queued.getresponse().read(), 'hello /queued')
+
+def chunks_application(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    chunks = ['chunk %d ' % i for i in range(int(environ['QUERY_STRING']))]
+    if environ['PATH_INFO'] == '/iterator':
+        return iter(chunks)
+    return chunks
+
+class TestServerResponseBuffering(ServerTestCase):
+    application = staticmethod(chunks_application)
+
+    def test_small_list_response(self):
+        status, headers, body = self.request(self.connect(), '/list?3')
+        self.assertEqual(headers['content-length'], str(len(body)))
+        self.assertEqual(body, 'chunk 0 chunk 1 chunk 2 ')
+
+    def test_large_list_response(self):
+        status, headers, body = self.request(self.connect(), '/list?2000')
+        self.assertEqual(headers['transfer-encoding'], 'chunked')
+        self.assertEqual(body, ''.join('chunk %d ' % i for i in range(2000)))
+
+    def test_iterator_response(self):
+        connection = self.connect()
+        for i in range(2):
+            status, headers, body = self.request(connection, '/iterator?3')
+            self.assertEqual(headers['transfer-encoding'], 'chunked')
+            self.assertEqual(body, 'chunk 0 chunk 1 chunk 2 ')
+
+FILE_CONTENT = ''.join(chr(i % 256) for i in range(1024 * 1024 + 7))
+
+def file_application(environ, start_response):
+    openfile = TemporaryFile()
+    openfile.write(FILE_CONTENT)
+    openfile.seek(0)
+
+    headers = [('Content-Type', 'application/octet-stream')]
+    if environ['PATH_INFO'] in ('/sized', '/truncated'):
+        headers.append(('Content-Length', str(len(FILE_CONTENT))))
+    start_response('200 OK', headers)
+    if environ['PATH_INFO'] == '/truncated':
+        openfile.truncate(len(FILE_CONTENT) // 2)
+    return environ['wsgi.file_wrapper'](openfile)
+
+class TestServerFileWrapper(ServerTestCase):
+    application = staticmethod(file_application)
+
+    def test_file_with_content_length(self):
+        connection = self.connect()
+        for i in range(2):
+            status, headers, body = self.request(connection, '/sized')
+            self.assertEqual(headers['content-length'], str(len(FILE_CONTENT)))
+            self.assertTrue(body == FILE_CONTENT)
+
+    def test_file_without_content_length(self):
+        status, headers, body = self.request(self.connect(), '/chunked')
+        self.assertEqual(headers['transfer-encoding'], 'chunked')
+        self.assertTrue(body == FILE_CONTENT)
+
+    def test_truncated_file_closes_connection(self):
+        errors = []
+        self.server.error_log = lambda msg='', *args, **params: errors.append(msg)
+
+        connection = self.connect()
+        connection.request('GET', '/truncated')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertRaises(IncompleteRead, response.read)
+        self.assertEqual(len(errors), 1)
+        self.assertIn('shorter than the declared Content-Length', errors[0])
+
+def pid_application(environ, start_response):
+    body = '%d %s' % (os.getpid(), environ['wsgi.multiprocess'])
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+        ('Content-Length', str(len(body)))])
+    return [body]
+
+class TestPreforkServer(TestCase):
+    engine = 'threaded'
+
+    def setUp(self):
+        self.server = WsgiServer(('127.0.0.1', 0), pid_application, numthreads=2,
+            processes=2, engine=self.engine)
+        self.server.prepare()
+        self.port = self.server.socket.getsockname()[1]
+
+        self.master = os.fork()
+        if not self.master:
+            try:
+                self.server.serve()
+            finally:
+                os._exit(0)
+        self.server.socket.close()
+
+    def tearDown(self):
+        try:
+            os.kill(self.master, signal.SIGTERM)
+            os.waitpid(self.master, 0)
+        except OSError:
+            pass
+
+    def request(self):
+        connection = HTTPConnection('127.0.0.1', self.port, timeout=5)
+        connection.request('GET', '/')
+        pid, multiprocess = connection.getresponse().read().split(' ')
+        connection.close()
+        return int(pid), multiprocess
+
+    def test_workers_are_restarted(self):
+        pid, multiprocess = self.request()
+        self.assertNotEqual(pid, self.master)
+        self.assertEqual(multiprocess, 'True')
+
+        os.kill(pid, signal.SIGKILL)
+        time.sleep(self.server.respawn_delay + .5)
+        for i in range(4):
+            self.assertNotEqual(self.request()[0], pid)
+
+    def test_graceful_shutdown(self):
+        self.request()
+        os.kill(self.master, signal.SIGTERM)
+        pid, status = os.waitpid(self.master, 0)
+        self.assertEqual(status, 0)
+        self.assertRaises(socket.error, self.request)
+
+def master_application(environ, start_response):
+    body = str(os.getppid() if environ['wsgi.multiprocess'] else os.getpid())
+    start_response('200 OK', [('Content-Length', str(len(body)))])
+    return [body]
+
+SUCCESSOR = """
+import os, sys
+from spire.wsgi.server import WsgiServer
+
+def application(environ, start_response):
+    body = str(os.getppid() if environ['wsgi.multiprocess'] else os.getpid())
+    start_response('200 OK', [('Content-Length', str(len(body)))])
+    return [body]
+
+WsgiServer(('127.0.0.1', %d), application, numthreads=2, processes=%d).serve()
+"""
+
+class TestExitStatus(TestCase):
+    def test_describe_exit_status(self):
+        self.assertEqual(describe_exit_status(0), 'exited with status 0')
+        self.assertEqual(describe_exit_status(1 << 8), 'exited with status 1')
+        self.assertEqual(describe_exit_status(signal.SIGKILL),
+            'was killed by signal %d' % signal.SIGKILL)
+
+class TestServerHandoff(TestCase):
+    processes = 1
+
+    def setUp(self):
+        self.server = WsgiServer(('127.0.0.1', 0), master_application, numthreads=2,
+            processes=self.processes, handoff=True)
+        self.server.prepare()
+        self.port = self.server.socket.getsockname()[1]
+        self.server.reexec_command = [sys.executable, '-c',
+            SUCCESSOR % (self.port, self.processes)]
+
+        self.process = os.fork()
+        if not self.process:
+            try:
+                self.server.serve()
+            finally:
+                os._exit(0)
+        self.server.socket.close()
+        self.successor = None
+
+    def tearDown(self):
+        for pid in (self.process, self.successor):
+            if pid:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+
+    def request(self):
+        connection = HTTPConnection('127.0.0.1', self.port, timeout=5)
+        connection.request('GET', '/')
+        pid = int(connection.getresponse().read())
+        connection.close()
+        return pid
+
+    def test_handoff(self):
+        self.assertEqual(self.request(), self.process)
+        os.kill(self.process, signal.SIGUSR2)
+
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            pid = self.request()
+            if pid != self.process:
+                self.successor = pid
+                break
+            time.sleep(.05)
+        self.assertIsNotNone(self.successor)
+
+        pid, status = os.waitpid(self.process, 0)
+        self.assertEqual(status, 0)
+        self.process = None
+        for i in range(4):
+            self.assertEqual(self.request(), self.successor)
+
+    def test_inherited_socket(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(5)
+        port = listener.getsockname()[1]
+
+        os.environ['SPIRE_LISTEN_FD'] = str(os.dup(listener.fileno()))
+        listener.close()
+        try:
+            server = WsgiServer(('127.0.0.1', port), hello_application)
+            server.prepare()
+        finally:
+            os.environ.pop('SPIRE_LISTEN_FD', None)
+
+        self.assertEqual(server.socket.getsockname()[1], port)
+        server.socket.close()
+
+class TestPreforkServerHandoff(TestServerHandoff):
+    processes = 2
+
+class TestRerunCommand(TestCase):
+    def setUp(self):
+        self.argv = sys.argv
+        self.package = getattr(sys.modules['__main__'], '__package__', None)
+
+    def tearDown(self):
+        sys.argv = self.argv
+        sys.modules['__main__'].__package__ = self.package
+
+    def test_script(self):
+        sys.argv = ['/srv/app/serve.py', '127.0.0.1:8000']
+        sys.modules['__main__'].__package__ = None
+        self.assertEqual(rerun_command(), [sys.executable] + sys.argv)
+
+    def test_module(self):
+        sys.argv = ['/srv/spire/runtime/wsgi.py', '127.0.0.1:8000']
+        sys.modules['__main__'].__package__ = 'spire.runtime'
+        self.assertEqual(rerun_command(),
+            [sys.executable, '-m', 'spire.runtime.wsgi', '127.0.0.1:8000'])
+
+    def test_package(self):
+        sys.argv = ['/srv/app/__main__.py']
+        sys.modules['__main__'].__package__ = 'app'
+        self.assertEqual(rerun_command(), [sys.executable, '-m', 'app'])
+
+class TestEventServer(TestServer):
+    engine = 'event'
+    numthreads = 1
+
+    def test_event_loop(self):
+        self.assertIsInstance(self.server.monitor, EventLoop)
+
+    def test_incomplete_heads_do_not_occupy_workers(self):
+        slow = socket.create_connection(('127.0.0.1', self.port))
+        slow.sendall('GET /slow HTTP/1.1\r\nHost: localhost\r\n')
+        time.sleep(.1)
+
+        status, headers, body = self.request(self.connect(), '/fast')
+        self.assertEqual(body, 'hello /fast')
+
+        slow.sendall('\r\n')
+        self.assertIn('hello /slow', slow.recv(4096))
+        slow.close()
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, WsgiServer, ('127.0.0.1', 0),
+            hello_application, engine='unknown')
+
+class FailingListener(object):
+    def accept(self):
+        raise socket.error(errno.EMFILE, 'Too many open files')
+
+class TestAcceptErrors(TestCase):
+    def test_errors_keep_their_traceback(self):
+        server = HTTPServer(('127.0.0.1', 0), None)
+        server.socket = FailingListener()
+        for accept in (server.accept, lambda: server.accept_many(4)):
+            try:
+                accept()
+            except socket.error:
+                traceback = sys.exc_info()[2]
+                while traceback.tb_next:
+                    traceback = traceback.tb_next
+                self.assertEqual(traceback.tb_frame.f_code.co_name, 'accept')
+            else:
+                self.fail('socket.error not raised')
+        self.assertEqual(server.stats['Socket Errors'], 2)
+
+class TestBatchedAcceptServer(TestServer):
+    accept_batch = 16
+
+    def construct_server(self):
+        server = super(TestBatchedAcceptServer, self).construct_server()
+        server.defer_accept = 1
+        return server
+
+    def test_connection_storm(self):
+        self.assertIsNotNone(self.server._acceptor)
+
+        clients = []
+        for i in range(40):
+            client = socket.create_connection(('127.0.0.1', self.port))
+            client.sendall('GET /%d HTTP/1.1\r\nHost: localhost\r\n'
+                'Connection: close\r\n\r\n' % i)
+            clients.append(client)
+
+        for i, client in enumerate(clients):
+            client.settimeout(5)
+            response = ''
+            while True:
+                data = client.recv(4096)
+                if not data:
+                    break
+                response += data
+            client.close()
+            self.assertTrue(response.endswith('hello /%d' % i))
+        self.assertEqual(self.server.stats['Accepts'], 40)
+
+class TestBatchedAcceptServerLoadShedding(TestServerLoadShedding):
+    accept_batch = 16
+
+class TestEventServerEnviron(TestServerEnviron):
+    engine = 'event'
+
+class TestEventServerRequestBodies(TestServerRequestBodies):
+    engine = 'event'
+
+class TestEventServerIdleTimeout(TestServerIdleTimeout):
+    engine = 'event'
+
+class TestEventServerLoadShedding(TestServerLoadShedding):
+    engine = 'event'
+
+class TestEventServerResponseBuffering(TestServerResponseBuffering):
+    engine = 'event'
+
+class TestEventServerFileWrapper(TestServerFileWrapper):
+    engine = 'event'
+
+class TestEventPreforkServer(TestPreforkServer):
+    engine = 'event'
+
+class TestEventServerDeadlines(TestServerDeadlines):
+    engine = 'event'
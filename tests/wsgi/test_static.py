@@ -0,0 +1,135 @@
+import gzip
+import os
+import shutil
+from tempfile import mkdtemp
+
+from unittest2 import TestCase
+from werkzeug.http import http_date
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from spire.wsgi.static import StaticFiles
+
+CONTENT = 'body { color: black; }\n' * 100
+
+class TestStaticFiles(TestCase):
+    def setUp(self):
+        self.root = mkdtemp()
+        self.write('style.css', CONTENT)
+        self.write('large.bin', CONTENT * 10)
+        os.mkdir(os.path.join(self.root, 'directory'))
+
+        openfile = gzip.open(os.path.join(self.root, 'style.css.gz'), 'wb')
+        openfile.write(CONTENT)
+        openfile.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, content):
+        openfile = open(os.path.join(self.root, name), 'wb')
+        try:
+            openfile.write(content)
+        finally:
+            openfile.close()
+
+    def construct_client(self, **params):
+        params.setdefault('check_interval', 0)
+        mount = StaticFiles(path='/static', root=self.root, **params)
+        return Client(mount, BaseResponse)
+
+    def test_file(self):
+        client = self.construct_client()
+        for i in range(2):
+            response = client.get('/style.css')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data, CONTENT)
+            self.assertEqual(response.headers['Content-Type'], 'text/css')
+            self.assertEqual(response.headers['Content-Length'], str(len(CONTENT)))
+            self.assertIn('ETag', response.headers)
+            self.assertIn('Last-Modified', response.headers)
+
+    def test_missing_files(self):
+        client = self.construct_client()
+        for path in ('/missing.css', '/directory', '/', '/../style.css'):
+            self.assertEqual(client.get(path).status_code, 404)
+        self.assertEqual(client.post('/style.css').status_code, 405)
+
+    def test_nul_bytes(self):
+        client = self.construct_client()
+        for path in ('/style.css%00', '/style.css%00.gz', '/%00/style.css'):
+            self.assertEqual(client.get(path).status_code, 404)
+
+    def test_large_file(self):
+        client = self.construct_client(max_file_size=len(CONTENT))
+        response = client.get('/large.bin')
+        self.assertEqual(response.data, CONTENT * 10)
+
+        response = client.get('/large.bin', headers=[('Range', 'bytes=10-19')])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, (CONTENT * 10)[10:20])
+
+    def test_conditional_requests(self):
+        client = self.construct_client()
+        response = client.get('/style.css')
+        etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+        response = client.get('/style.css', headers=[('If-None-Match', etag)])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, '')
+
+        response = client.get('/style.css', headers=[('If-Modified-Since', last_modified)])
+        self.assertEqual(response.status_code, 304)
+
+        response = client.get('/style.css', headers=[('If-None-Match', '"other"')])
+        self.assertEqual(response.status_code, 200)
+
+    def test_changed_file(self):
+        client = self.construct_client()
+        etag = client.get('/style.css').headers['ETag']
+
+        self.write('style.css', 'changed')
+        os.utime(os.path.join(self.root, 'style.css'), (1000000000, 1000000000))
+
+        response = client.get('/style.css', headers=[('If-None-Match', etag)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, 'changed')
+        self.assertEqual(response.headers['Last-Modified'], http_date(1000000000))
+
+    def test_ranges(self):
+        client = self.construct_client()
+        response = client.get('/style.css', headers=[('Range', 'bytes=5-9')])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, CONTENT[5:10])
+        self.assertEqual(response.headers['Content-Range'], 'bytes 5-9/%d' % len(CONTENT))
+
+        response = client.get('/style.css', headers=[('Range', 'bytes=-5')])
+        self.assertEqual(response.data, CONTENT[-5:])
+
+        response = client.get('/style.css', headers=[('Range', 'bytes=%d-' % len(CONTENT))])
+        self.assertEqual(response.status_code, 416)
+
+        response = client.get('/style.css', headers=[('Range', 'bytes=5-9'),
+            ('If-Range', '"stale"')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, CONTENT)
+
+    def test_precompressed_files(self):
+        client = self.construct_client(precompressed=True)
+        response = client.get('/style.css', headers=[('Accept-Encoding', 'gzip')])
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Content-Type'], 'text/css')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertNotEqual(response.data, CONTENT)
+
+        response = client.get('/style.css')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, CONTENT)
+
+    def test_cache_is_bounded(self):
+        mount = StaticFiles(path='/static', root=self.root, cache_size=len(CONTENT) * 2)
+        client = Client(mount, BaseResponse)
+        client.get('/style.css')
+        client.get('/large.bin')
+        self.assertLessEqual(mount.cache.size, len(CONTENT) * 2)
+        self.assertEqual(client.get('/large.bin').data, CONTENT * 10)
@@ -0,0 +1,51 @@
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from jinja2 import TemplateSyntaxError
+from unittest2 import TestCase
+
+from spire.wsgi.templates import TemplateEnvironment
+
+class TestTemplateEnvironment(TestCase):
+    def setUp(self):
+        self.cache_dir = os.path.join(mkdtemp(), 'templates')
+
+    def tearDown(self):
+        rmtree(os.path.dirname(self.cache_dir))
+
+    def test_bytecode_cache(self):
+        environment = TemplateEnvironment([('tests.wsgi', 'templates')],
+            cache_dir=self.cache_dir)
+        self.assertEqual(environment.render_template('hello.html', {'name': 'world'}),
+            'hello world')
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        environment = TemplateEnvironment([('tests.wsgi', 'templates')],
+            cache_dir=self.cache_dir)
+        self.assertEqual(environment.render_template('hello.html', {'name': 'again'}),
+            'hello again')
+
+    def test_precompile(self):
+        environment = TemplateEnvironment([('tests.wsgi', 'templates')],
+            cache_dir=self.cache_dir)
+        failures = environment.precompile()
+
+        self.assertEqual([name for name, exception in failures],
+            ['broken.html', 'latin1.html'])
+        self.assertIsInstance(failures[0][1], TemplateSyntaxError)
+        self.assertIsInstance(failures[1][1], UnicodeDecodeError)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertEqual(len(environment.cache), 2)
+
+    def test_stream_template(self):
+        environment = TemplateEnvironment([('tests.wsgi', 'templates')])
+        context = {'items': range(10)}
+        expected = environment.render_template('items.html', context)
+
+        chunks = list(environment.stream_template('items.html', context, 0))
+        self.assertEqual(u''.join(chunks), expected)
+
+        buffered = list(environment.stream_template('items.html', context, 4))
+        self.assertEqual(u''.join(buffered), expected)
+        self.assertLess(len(buffered), len(chunks))
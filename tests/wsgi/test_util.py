@@ -0,0 +1,49 @@
+from unittest2 import TestCase
+
+from spire.wsgi.util import MountDispatcher
+
+class FakeMount(object):
+    def __init__(self, path, shared_path=''):
+        self.path = path
+        self.shared_path = shared_path
+        self.unshared_path = path[:-len(shared_path)] if shared_path else path
+
+    def __call__(self, environ, start_response):
+        return [self, environ['SCRIPT_NAME'], environ['PATH_INFO']]
+
+class TestMountDispatcher(TestCase):
+    def dispatch(self, dispatcher, path, start_response=None):
+        return dispatcher({'REQUEST_METHOD': 'GET', 'PATH_INFO': path}, start_response)
+
+    def test_longest_prefix(self):
+        root, api, users = FakeMount('/'), FakeMount('/api'), FakeMount('/api/users')
+        dispatcher = MountDispatcher([root, api, users])
+
+        self.assertEqual(self.dispatch(dispatcher, '/api/users/1'), [users, '/api/users', '/1'])
+        self.assertEqual(self.dispatch(dispatcher, '/api/users'), [users, '/api/users', ''])
+        self.assertEqual(self.dispatch(dispatcher, '/api/usersx'), [api, '/api', '/usersx'])
+        self.assertEqual(self.dispatch(dispatcher, '/api/'), [api, '/api', '/'])
+        self.assertEqual(self.dispatch(dispatcher, '/other/path'), [root, '/', '/other/path'])
+        self.assertEqual(self.dispatch(dispatcher, '/'), [root, '/', ''])
+        self.assertEqual(self.dispatch(dispatcher, ''), [root, '/', ''])
+
+    def test_shared_path(self):
+        mount = FakeMount('/app/static', '/static')
+        dispatcher = MountDispatcher([mount])
+        self.assertEqual(self.dispatch(dispatcher, '/app/static/style.css'),
+            [mount, '/app', '/static/style.css'])
+
+    def test_not_found(self):
+        responses = []
+        def start_response(status, headers):
+            responses.append(status)
+
+        dispatcher = MountDispatcher([FakeMount('/api')])
+        self.dispatch(dispatcher, '/other', start_response)
+        self.assertEqual(responses, ['404 NOT FOUND'])
+
+    def test_resolve(self):
+        api = FakeMount('/api')
+        dispatcher = MountDispatcher([api])
+        self.assertEqual(dispatcher.resolve('/api/a/b'), (api, '/api', '/a/b'))
+        self.assertEqual(dispatcher.resolve('/ap'), (None, '', '/ap'))